@@ -19,6 +19,8 @@
 #  MA 02110-1301, USA.
 #
 #
+import pcbnew
+from place_footprints import TEXT_PROPERTIES
 
 
 def getIndex(s, i): 
@@ -123,4 +125,70 @@ def compare_boards(filename1, filename2):
             else:
                 # this is a problem
                 errnum = errnum + 1
-    return errnum
\ No newline at end of file
+    return errnum
+
+
+# angles read back from a saved board have limited precision
+ANGLE_TOLERANCE = 1e-3
+
+
+def get_text_items(footprint):
+    return [footprint.Reference(), footprint.Value()] + \
+           [x for x in footprint.GraphicalItems() if type(x) is pcbnew.FP_TEXT]
+
+
+def get_board_state(board):
+    """
+    get placement of all footprints and their text items, by footprint reference
+    this is all that placing footprints changes, so boards can be compared without saving them
+    """
+    state = {}
+    for footprint in board.GetFootprints():
+        position = footprint.GetPosition()
+        texts = []
+        for text in get_text_items(footprint):
+            text_position = text.GetPosition()
+            texts.append((text_position.x, text_position.y) + tuple(getattr(text, x[0])() for x in TEXT_PROPERTIES))
+        state[footprint.GetReference()] = ((position.x, position.y, footprint.GetOrientationDegrees(),
+                                            footprint.IsFlipped()), texts)
+    return state
+
+
+def restore_board_state(board, state):
+    """ move footprints and their text items back to the state from get_board_state """
+    for footprint in board.GetFootprints():
+        (pos_x, pos_y, orientation, flipped), texts = state[footprint.GetReference()]
+        if footprint.IsFlipped() != flipped:
+            footprint.Flip(footprint.GetPosition(), False)
+        footprint.SetPosition(pcbnew.wxPoint(pos_x, pos_y))
+        footprint.SetOrientationDegrees(orientation)
+        for text, text_state in zip(get_text_items(footprint), texts):
+            for (getter, setter), value in zip(TEXT_PROPERTIES, text_state[2:]):
+                getattr(text, setter)(value)
+            text.SetPosition(pcbnew.wxPoint(text_state[0], text_state[1]))
+
+
+def same_values(values1, values2):
+    if len(values1) != len(values2):
+        return False
+    for value1, value2 in zip(values1, values2):
+        if isinstance(value1, float) or isinstance(value2, float):
+            if abs(value1 - value2) > ANGLE_TOLERANCE:
+                return False
+        elif value1 != value2:
+            return False
+    return True
+
+
+def compare_board_states(state1, state2):
+    """ in memory counterpart of compare_boards, returns number of footprints which are placed differently """
+    errnum = 0
+    for ref in state1.keys() | state2.keys():
+        if ref not in state1 or ref not in state2:
+            errnum = errnum + 1
+            continue
+        (fp1, texts1), (fp2, texts2) = state1[ref], state2[ref]
+        if not same_values(fp1, fp2) or len(texts1) != len(texts2) \
+                or not all(same_values(x, y) for x, y in zip(texts1, texts2)):
+            errnum = errnum + 1
+    return errnum
@@ -31,11 +31,14 @@ cp place_footprints_dark.png plugins
 cp place_footprints_light.png plugins
 cp __init__.py plugins
 cp action_place_footprints.py plugins
+cp place_footprints_dialogs.py plugins
 cp initial_dialog_GUI.py plugins
 cp place_by_reference_GUI.py plugins
 cp place_by_sheet_GUI.py plugins
 cp error_dialog_GUI.py plugins
 cp place_footprints.py plugins
+cp place_footprints_scan.py plugins
+cp place_footprints_daemon.py plugins
 cp version.txt plugins
 mkdir resources
 cp place_footprints.png resources/icon.png
@@ -20,38 +20,343 @@
 #
 #
 import pcbnew
-from collections import namedtuple
+from collections import namedtuple, deque
+from array import array
+from bisect import bisect_left, bisect_right
 import os
 import logging
-import itertools
 import math
+import re
+import json
+import hashlib
+import concurrent.futures
+import time
+
+# board file scanning runs in worker processes, so it lives in a module which does not import pcbnew
+try:
+    from .place_footprints_scan import scan_board_file
+except ImportError:
+    from place_footprints_scan import scan_board_file
 
 
 SCALE = 1000000.0
 
-Footprint = namedtuple('Footprint', ['ref', 'fp', 'fp_id', 'sheet_id', 'filename'])
+# footprints with same reference designator sorted by their number, offsets are number - position
+# and are constant along consecutive numbers, so the runs can be found by binary search
+Designator = namedtuple('Designator', ['numbers', 'refs', 'offsets'])
+# footprint placement, position is a tuple of integer coordinates and orientation is in degrees
+Pose = namedtuple('Pose', ['position', 'orientation', 'flipped'])
+# KiCad normalizes footprint orientation and keeps it in tenths of degree
+ANGLE_TOLERANCE = 0.05
+NUMBERS = re.compile('([0-9]+)')
+# schematic hierarchy parsed in corner cases is cached in the project folder
+HIERARCHY_CACHE_FILE = 'place_footprints_cache.json'
+HIERARCHY_CACHE_VERSION = 1
+# schematics files on the same depth of the hierarchy are read by this many threads
+SCHEMATIC_READ_THREADS = 8
+# number of placement plans kept by each Placer
+PLAN_CACHE_SIZE = 16
+TEMPLATE_VERSION = 1
+# when placing with progress reporting, footprints are moved in chunks which take about this long (in seconds)
+APPLY_CHUNK_TIME = 0.1
+# text item properties set when replicating text items, as (getter, setter) names
+TEXT_PROPERTIES = [('GetLayer', 'SetLayer'),
+                   ('GetTextAngle', 'SetTextAngle'),
+                   ('GetTextThickness', 'SetTextThickness'),
+                   ('GetTextWidth', 'SetTextWidth'),
+                   ('GetTextHeight', 'SetTextHeight'),
+                   ('IsItalic', 'SetItalic'),
+                   ('IsBold', 'SetBold'),
+                   ('IsMirrored', 'SetMirrored'),
+                   ('IsMultilineAllowed', 'SetMultilineAllowed'),
+                   ('GetHorizJustify', 'SetHorizJustify'),
+                   ('GetVertJustify', 'SetVertJustify'),
+                   ('IsKeepUpright', 'SetKeepUpright'),
+                   ('IsVisible', 'SetVisible')]
+# number of log records kept in memory until they are written to the log file
+LOG_BUFFER_SIZE = 10000
+# slot assignment is solved exactly up to this number of connected footprints and greedily above it
+ASSIGNMENT_EXACT_SIZE = 500
+# nets with more pads (power, ground) connect everywhere and are ignored when assigning slots
+ASSIGNMENT_MAX_NET_PADS = 32
+
+# angles are rounded before hashing footprints, as board files hold them with limited precision
+HASH_ANGLE_DIGITS = 3
+FP_TEXT_LINE = re.compile(r'\s*\(fp_text (\w+) "((?:[^"\\]|\\.)*)" '
+                          r'\(at ([-\d.]+) ([-\d.]+)(?: ([-\d.]+))?(?: unlocked)?\) \(layer "([^"]+)"\)( hide)?')
+
+# Placer instances are kept between plugin runs (per board file) and refreshed incrementally
+placers = {}
 logger = logging.getLogger(__name__)
 
 
+class RingBufferHandler(logging.Handler):
+    """
+    keep the latest log records in memory and write them to the log file only when flushed,
+    which happens on errors and when logging is shut down
+    """
+    def __init__(self, filename, capacity=LOG_BUFFER_SIZE, flush_level=logging.ERROR):
+        super(RingBufferHandler, self).__init__()
+        self.filename = os.path.abspath(filename)
+        self.records = deque(maxlen=capacity)
+        self.flush_level = flush_level
+        self.dropped = 0
+        self.mode = 'w'
+
+    def emit(self, record):
+        if len(self.records) == self.records.maxlen:
+            self.dropped = self.dropped + 1
+        self.records.append(record)
+        if record.levelno >= self.flush_level:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if not self.records:
+                return
+            with open(self.filename, self.mode, encoding='utf-8') as f:
+                if self.dropped:
+                    f.write("%d older log records were dropped\n" % self.dropped)
+                for record in self.records:
+                    try:
+                        f.write(self.format(record) + "\n")
+                    except Exception:
+                        self.handleError(record)
+            # the rest of the records are appended
+            self.records.clear()
+            self.dropped = 0
+            self.mode = 'a'
+        finally:
+            self.release()
+
+
+class JsonFormatter(logging.Formatter):
+    """ format log records as compact JSON objects """
+    def format(self, record):
+        entry = {'time': record.created, 'name': record.name, 'line': record.lineno,
+                 'level': record.levelname, 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(',', ':'))
+
+
+def to_iu(value):
+    """
+    convert coordinate to integer internal units, values which are only float noise away from an integer
+    are snapped to it, others are truncated toward zero
+    """
+    nearest = round(value)
+    if abs(value - nearest) < 1e-6:
+        return int(nearest)
+    return int(value)
+
+
+class Transform:
+    """
+    2D affine transform p' = L(p - origin) + offset, where L rotates for angle (in degrees),
+    preceded by mirroring around x axis if flipped (as pcbnew flips footprints to the other side)
+    Rotated coordinates are floats, use apply_int to convert them to internal units (see to_iu).
+    Translations of integer coordinates by integer offsets stay exact integers
+    """
+    __slots__ = ('angle', 'flipped', 'origin', 'offset', 'matrix')
+
+    def __init__(self, angle=0.0, flipped=False, origin=(0, 0), offset=(0, 0)):
+        self.angle = angle
+        self.flipped = flipped
+        self.origin = (origin[0], origin[1])
+        self.offset = (offset[0], offset[1])
+        # cos and sin are computed only once per transform
+        if angle % 360 == 0:
+            cos, sin = 1, 0
+        else:
+            cos = math.cos(2 * math.pi * angle/360)
+            sin = math.sin(2 * math.pi * angle/360)
+        if flipped:
+            self.matrix = (cos, sin, sin, -cos)
+        else:
+            self.matrix = (cos, -sin, sin, cos)
+
+    @classmethod
+    def translation(cls, delta_x, delta_y):
+        return cls(offset=(delta_x, delta_y))
+
+    @classmethod
+    def rotation(cls, angle, point=(0, 0)):
+        """ rotation for angle in degrees around point """
+        return cls(angle, False, point, point)
+
+    @classmethod
+    def flip(cls, point=(0, 0)):
+        """ mirroring around horizontal axis through point """
+        return cls(0.0, True, point, point)
+
+    def is_translation(self):
+        return self.matrix == (1, 0, 0, 1)
+
+    def then(self, other):
+        """ get transform which applies this transform and then the other one """
+        if self.is_translation():
+            # keep integer origins integer, so that relative coordinates are computed exactly
+            origin = (self.origin[0] - self.offset[0] + other.origin[0],
+                      self.origin[1] - self.offset[1] + other.origin[1])
+            return Transform(other.angle, other.flipped, origin, other.offset)
+        # flipping reverses the direction of preceding rotation
+        angle = other.angle + (-self.angle if other.flipped else self.angle)
+        delta_x, delta_y = other.apply_vector((self.offset[0] - other.origin[0], self.offset[1] - other.origin[1]))
+        return Transform(angle, self.flipped != other.flipped, self.origin,
+                         (delta_x + other.offset[0], delta_y + other.offset[1]))
+
+    def apply_point(self, point):
+        a, b, c, d = self.matrix
+        rel_x = point[0] - self.origin[0]
+        rel_y = point[1] - self.origin[1]
+        return a * rel_x + b * rel_y + self.offset[0], c * rel_x + d * rel_y + self.offset[1]
+
+    def apply_vector(self, vector):
+        """ transform a vector (difference of points), only rotation and mirroring apply """
+        a, b, c, d = self.matrix
+        return a * vector[0] + b * vector[1], c * vector[0] + d * vector[1]
+
+    def apply(self, points):
+        """ transform a sequence of points """
+        a, b, c, d = self.matrix
+        origin_x, origin_y = self.origin
+        offset_x, offset_y = self.offset
+        return [(a * (x - origin_x) + b * (y - origin_y) + offset_x, c * (x - origin_x) + d * (y - origin_y) + offset_y)
+                for x, y in points]
+
+    def apply_int(self, points):
+        """ transform a sequence of points and convert the coordinates to integer internal units """
+        return [(to_iu(x), to_iu(y)) for x, y in self.apply(points)]
+
+    def apply_orientation(self, orientation):
+        """ get footprint orientation (in degrees) after the transform """
+        return (-orientation if self.flipped else orientation) - self.angle
+
+
 def rotate_around_center(coordinates, angle):
     """ rotate coordinates for a defined angle in degrees around coordinate center"""
-    new_x = coordinates[0] * math.cos(2 * math.pi * angle/360)\
-          - coordinates[1] * math.sin(2 * math.pi * angle/360)
-    new_y = coordinates[0] * math.sin(2 * math.pi * angle/360)\
-          + coordinates[1] * math.cos(2 * math.pi * angle/360)
-    return new_x, new_y
+    return Transform.rotation(angle).apply_point(coordinates)
 
 
 def rotate_around_point(old_position, point, angle):
     """ rotate coordinates for a defined angle in degrees around a point """
-    # get relative position to point
-    rel_x = old_position[0] - point[0]
-    rel_y = old_position[1] - point[1]
-    # rotate around
-    new_rel_x, new_rel_y = rotate_around_center((rel_x, rel_y), angle)
-    # get absolute position
-    new_position = (new_rel_x + point[0], new_rel_y + point[1])
-    return new_position
+    return Transform.rotation(angle, point).apply_point(old_position)
+
+
+def same_angle(angle1, angle2):
+    """ check if two angles in degrees point the same way """
+    difference = (angle1 - angle2) % 360.0
+    return min(difference, 360.0 - difference) < ANGLE_TOLERANCE
+
+
+def natural_sort_key(text):
+    """ key for sorting strings with embedded numbers in natural order (R2 before R10) """
+    return tuple(int(c) if c.isdigit() else c.lower() for c in NUMBERS.split(text))
+
+
+def iter_bits(bits):
+    """ iterate over indices of set bits in a bitset """
+    # going through bytes avoids operations on the whole bitset for every bit
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for position, byte in enumerate(data):
+        while byte:
+            lowest = byte & -byte
+            yield (position << 3) + lowest.bit_length() - 1
+            byte = byte ^ lowest
+
+
+def bits_from_indices(indices):
+    """ get a bitset with bits at indices set """
+    data = bytearray()
+    for index in indices:
+        if index >> 3 >= len(data):
+            data.extend(bytes((index >> 3) + 1 - len(data)))
+        data[index >> 3] = data[index >> 3] | (1 << (index & 7))
+    return int.from_bytes(data, 'little')
+
+
+def get_file_fingerprint(filename, known=None):
+    """ get [mtime, size, hash] of a file, the hash is reused from known fingerprint if mtime and size match """
+    stat = os.stat(filename)
+    if known is not None and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+        return known
+    with open(filename, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return [stat.st_mtime_ns, stat.st_size, digest]
+
+
+def get_footprint_record_hash(ref, position, orientation, flipped, texts):
+    """
+    get hash of footprint pose and its text items, given as (position relative to footprint, angle on the board,
+    layer name, visibility) tuples
+    """
+    record = (ref, position, round(orientation, HASH_ANGLE_DIGITS) % 360.0, flipped,
+              [(x[0], round(x[1], HASH_ANGLE_DIGITS) % 360.0, x[2], x[3]) for x in texts])
+    return hashlib.sha1(repr(record).encode('utf-8')).hexdigest()
+
+
+def get_footprint_hash(footprint):
+    """ get hash of the footprint on the board, it is the same as the hash of the footprint saved to a file """
+    position = footprint.GetPosition()
+    text_items = [footprint.Reference(), footprint.Value()]
+    text_items.extend(x for x in footprint.GraphicalItems() if type(x) is pcbnew.FP_TEXT)
+    texts = []
+    for text in text_items:
+        local_position = text.GetPos0()
+        # text angle is held relative to the footprint, but it is saved as the angle on the board
+        texts.append(((local_position.x, local_position.y), (text.GetTextAngle() + footprint.GetOrientation()) / 10,
+                      pcbnew.BOARD.GetStandardLayerName(text.GetLayer()), text.IsVisible()))
+    return get_footprint_record_hash(footprint.GetReference(), (position.x, position.y),
+                                     footprint.GetOrientationDegrees(), footprint.IsFlipped(), texts)
+
+
+def get_board_footprint_hashes(board):
+    """ get footprint reference -> hash for all footprints on the board """
+    return {fp.GetReference(): get_footprint_hash(fp) for fp in board.GetFootprints()}
+
+
+def get_file_footprint_hashes(filename):
+    """ get footprint reference -> hash for all footprints in a .kicad_pcb file, without loading the board """
+    hashes = {}
+    record = None
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('  (footprint '):
+                # ref, position, orientation, flipped, texts
+                record = [None, (0, 0), 0.0, '(layer "B.Cu")' in line, []]
+            elif record is None:
+                continue
+            elif line.startswith('    (at '):
+                values = line.strip()[4:-1].split()
+                record[1] = (to_iu(float(values[0]) * SCALE), to_iu(float(values[1]) * SCALE))
+                if len(values) > 2:
+                    record[2] = float(values[2])
+            elif line.startswith('    (fp_text '):
+                match = FP_TEXT_LINE.match(line)
+                if match is None:
+                    raise LookupError("Text item of footprint in " + filename + " could not be read: " + line.strip())
+                if match.group(1) == 'reference':
+                    record[0] = re.sub(r'\\(.)', r'\1', match.group(2))
+                record[4].append(((to_iu(float(match.group(3)) * SCALE), to_iu(float(match.group(4)) * SCALE)),
+                                  float(match.group(5) or 0.0), match.group(6), match.group(7) is None))
+            elif line.startswith('  )'):
+                hashes[record[0]] = get_footprint_record_hash(*record)
+                record = None
+    return hashes
+
+
+def get_changed_footprints(old_hashes, new_hashes):
+    """ get references of footprints which were added, removed or changed between two sets of footprint hashes """
+    changed = [x for x, digest in new_hashes.items() if old_hashes.get(x) != digest]
+    changed.extend(x for x in old_hashes if x not in new_hashes)
+    return sorted(changed, key=natural_sort_key)
+
+
+def get_hashes_key(hashes):
+    """ get a key which changes whenever any footprint changes, to invalidate anything derived from footprints """
+    return '%040x' % (sum(int(x, 16) for x in hashes.values()) % (1 << 160))
 
 
 def get_index_of_tuple(list_of_tuples, index, value):
@@ -60,10 +365,171 @@ def get_index_of_tuple(list_of_tuples, index, value):
             return pos
 
 
+def solve_assignment(cost):
+    """
+    get column assigned to each row of a cost matrix with minimal total cost (Hungarian algorithm)
+    the matrix can have more columns than rows, the extra columns are left unassigned
+    """
+    size = len(cost)
+    columns = len(cost[0]) if cost else 0
+    # potentials and matching are indexed from 1, column 0 is a virtual one
+    row_potential = [0.0] * (size + 1)
+    column_potential = [0.0] * (columns + 1)
+    matched_row = [0] * (columns + 1)
+    previous = [0] * (columns + 1)
+    for row in range(1, size + 1):
+        matched_row[0] = row
+        column = 0
+        min_slack = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            current_row = matched_row[column]
+            costs = cost[current_row - 1]
+            potential = row_potential[current_row]
+            delta = math.inf
+            next_column = 0
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    slack = costs[j - 1] - potential - column_potential[j]
+                    if slack < min_slack[j]:
+                        min_slack[j] = slack
+                        previous[j] = column
+                    # on ties free columns are taken first, which keeps the paths short with many equal costs
+                    if min_slack[j] < delta or (min_slack[j] == delta and not matched_row[j]):
+                        delta = min_slack[j]
+                        next_column = j
+            for j in range(columns + 1):
+                if used[j]:
+                    row_potential[matched_row[j]] += delta
+                    column_potential[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            column = next_column
+            if matched_row[column] == 0:
+                break
+        # augment along the path
+        while column:
+            previous_column = previous[column]
+            matched_row[column] = matched_row[previous_column]
+            column = previous_column
+    assignment = [0] * size
+    for column in range(1, columns + 1):
+        if matched_row[column]:
+            assignment[matched_row[column] - 1] = column - 1
+    return assignment
+
+
+def solve_assignment_greedy(cost):
+    """ get column assigned to each row of a cost matrix with at least as many columns, cheapest pairs first """
+    size = len(cost)
+    pairs = sorted((value, row, column) for row, costs in enumerate(cost) for column, value in enumerate(costs))
+    assignment = [None] * size
+    taken = [False] * (len(cost[0]) if cost else 0)
+    remaining = size
+    for value, row, column in pairs:
+        if not remaining:
+            break
+        if assignment[row] is None and not taken[column]:
+            assignment[row] = column
+            taken[column] = True
+            remaining = remaining - 1
+    return assignment
+
+
+def solve_slot_assignment(cost):
+    """
+    get slot assigned to each footprint from a square matrix of footprint (row) costs in each slot (column)
+    footprints which cost the same in every slot (not connected to fixed footprints) are left out of the matrix,
+    they take the slots which are left over, their own slot if it is free
+    """
+    connected = [i for i, costs in enumerate(cost) if max(costs) != min(costs)]
+    connected_cost = [cost[i] for i in connected]
+    if len(connected) <= ASSIGNMENT_EXACT_SIZE:
+        connected_assignment = solve_assignment(connected_cost)
+    else:
+        connected_assignment = solve_assignment_greedy(connected_cost)
+    assignment = [None] * len(cost)
+    for row, column in zip(connected, connected_assignment):
+        assignment[row] = column
+    taken = set(connected_assignment)
+    unconnected = [i for i in range(len(cost)) if assignment[i] is None]
+    for row in unconnected:
+        if row not in taken:
+            assignment[row] = row
+            taken.add(row)
+    left_over = iter(x for x in range(len(cost)) if x not in taken)
+    for row in unconnected:
+        if assignment[row] is None:
+            assignment[row] = next(left_over)
+    return assignment
+
+
+def get_placer(board):
+    """ get Placer for the board, the one from the previous run on the same board is refreshed and reused """
+    filename = os.path.abspath(board.GetFileName())
+    placer = placers.get(filename)
+    if placer is None:
+        placer = Placer(board)
+    else:
+        try:
+            placer.refresh(board)
+        except Exception:
+            del placers[filename]
+            raise
+    placers[filename] = placer
+    return placer
+
+
+class Footprint:
+    """ lightweight view of one row in the Placer footprint table """
+    __slots__ = ('placer', 'index')
+
+    def __init__(self, placer, index):
+        self.placer = placer
+        self.index = index
+
+    @property
+    def ref(self):
+        return self.placer.get_ref(self.index)
+
+    @property
+    def fp(self):
+        return self.placer.get_footprint_proxy(self.index)
+
+    @property
+    def fp_id(self):
+        code = self.placer.fp_id_codes[self.index]
+        return self.placer.fp_id_table[code] if code >= 0 else None
+
+    @property
+    def sheet_id(self):
+        return self.placer.sheet_paths[self.placer.get_sheet_path_id(self.index)][0]
+
+    @property
+    def filename(self):
+        return self.placer.sheet_paths[self.placer.get_sheet_path_id(self.index)][1]
+
+    def __eq__(self, other):
+        return isinstance(other, Footprint) and self.placer is other.placer and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.placer), self.index))
+
+    def __repr__(self):
+        return "Footprint(ref=" + repr(self.ref) + ", fp_id=" + repr(self.fp_id) + \
+               ", sheet_id=" + repr(self.sheet_id) + ", filename=" + repr(self.filename) + ")"
+
+
 class Placer:
+    @staticmethod
+    def get_footprint_path(footprint):
+        """ get footprint hierarchical path as a list of uuids, with the root sheet as an empty string """
+        return footprint.GetPath().AsString().upper().replace('00000000-0000-0000-0000-0000', '').split("/")
+
     @staticmethod
     def get_footprint_id(footprint):
-        path = footprint.GetPath().AsString().upper().replace('00000000-0000-0000-0000-0000', '').split("/")
+        path = Placer.get_footprint_path(footprint)
         if len(path) != 1:
             fp_id = path[-1]
         # if path is empty, then footprint is not part of schematics
@@ -73,7 +539,7 @@ class Placer:
 
     @staticmethod
     def get_sheet_id(footprint):
-        path = footprint.GetPath().AsString().upper().replace('00000000-0000-0000-0000-0000', '').split("/")
+        path = Placer.get_footprint_path(footprint)
         if len(path) != 1:
             sheet_id = path[-2]
         # if path is empty, then footprint is not part of schematics
@@ -83,157 +549,726 @@ class Placer:
 
     def get_sheet_path(self, footprint):
         """ get sheet id """
-        path = footprint.GetPath().AsString().upper().replace('00000000-0000-0000-0000-0000', '').split("/")
+        return self.sheet_paths[self.intern_sheet_path(self.get_footprint_path(footprint))]
+
+    def intern_sheet_path(self, path):
+        """ get the index of the footprint path's sheet names and files in the shared sheet path table """
+        sheet_path = tuple(path[0:-1])
+        path_id = self.sheet_path_lookup.get(sheet_path)
+        if path_id is None:
+            if self.lazy:
+                self.resolve_sheets(sheet_path)
+            if len(path) != 1:
+                sheet_names = [self.dict_of_sheets[x][0] for x in sheet_path if x in self.dict_of_sheets]
+                sheet_files = [self.dict_of_sheets[x][1] for x in sheet_path if x in self.dict_of_sheets]
+                self.sheet_paths.append([sheet_names, sheet_files])
+            else:
+                self.sheet_paths.append(["", ""])
+            path_id = len(self.sheet_paths) - 1
+            self.sheet_path_lookup[sheet_path] = path_id
+        return path_id
+
+    def intern_fp_id(self, fp_id):
+        """ get the code of the footprint id in the shared footprint id table """
+        if fp_id is None:
+            return -1
+        code = self.fp_id_lookup.get(fp_id)
+        if code is None:
+            self.fp_id_table.append(fp_id)
+            code = len(self.fp_id_table) - 1
+            self.fp_id_lookup[fp_id] = code
+        return code
+
+    def append_footprint(self, ref, kiid, path):
+        """ add a footprint record to the footprint table """
+        self.ref_index[ref] = len(self.refs)
+        self.refs.append(ref)
+        self.kiids.append(kiid)
         if len(path) != 1:
-            sheet_path = path[0:-1]
-            sheet_names = [self.dict_of_sheets[x][0] for x in sheet_path if x in self.dict_of_sheets]
-            sheet_files = [self.dict_of_sheets[x][1] for x in sheet_path if x in self.dict_of_sheets]
-            sheet_path = [sheet_names, sheet_files]
+            self.fp_id_codes.append(self.intern_fp_id(path[-1]))
         else:
-            sheet_path = ["", ""]
-        return sheet_path
+            self.fp_id_codes.append(-1)
+        self.sheet_path_ids.append(self.intern_sheet_path(path))
+
+    def get_ref(self, index):
+        """ get reference of the table row, in lazy mode it is read from the board on first access """
+        ref = self.refs[index]
+        if ref is None:
+            ref = self.lazy_footprints[index].GetReference()
+            self.refs[index] = ref
+            self.ref_index.setdefault(ref, index)
+        return ref
+
+    def resolve_refs(self):
+        """ read all references from the board, needed only in lazy mode """
+        if self.lazy and not self.refs_resolved:
+            for i in range(len(self.refs)):
+                self.get_ref(i)
+            self.refs_resolved = True
+
+    def get_sheet_path_id(self, index):
+        """ get sheet path of the table row, in lazy mode it is interned on first access """
+        path_id = self.sheet_path_ids[index]
+        if path_id < 0:
+            path_id = self.intern_sheet_path(self.paths[index])
+            self.sheet_path_ids[index] = path_id
+        return path_id
+
+    def resolve_sheets(self, sheet_path):
+        """ read names and files of sheets on the path from footprint properties, needed only in lazy mode """
+        for sheet_id in sheet_path:
+            if not sheet_id or sheet_id in self.dict_of_sheets:
+                continue
+            for index in self.sheet_rows.get(sheet_id, []):
+                fp = self.lazy_footprints[index]
+                try:
+                    sheet_file = fp.GetProperty('Sheetfile')
+                    sheet_name = fp.GetProperty('Sheetname')
+                except KeyError:
+                    continue
+                if not sheet_file:
+                    logger.info("Footprint %s does not have Sheetfile property", fp.GetReference())
+                    raise LookupError("Footprint " + str(
+                        fp.GetReference()) + " doesn't have Sheetfile and Sheetname properties. "
+                                             "You need to update the layout from schematics")
+                self.dict_of_sheets[sheet_id] = [sheet_name, sheet_file]
+                break
+
+    def get_footprint_proxy(self, index):
+        """ get pcbnew footprint object for the table row, resolving it by KIID on first access """
+        if self.lazy:
+            return self.lazy_footprints[index]
+        kiid = self.kiids[index]
+        fp = self.fp_proxies.get(kiid)
+        if fp is None:
+            # resolve the whole board in one pass, as the first access is usually followed by others
+            self.fp_proxies = {x.m_Uuid.AsString(): x for x in self.board.GetFootprints()}
+            fp = self.fp_proxies[kiid]
+        return fp
+
+    @property
+    def footprints(self):
+        return [Footprint(self, i) for i in range(len(self.refs))]
 
     def get_fp_by_ref(self, ref):
-        for fp in self.footprints:
-            if fp.ref == ref:
-                return fp
+        index = self.ref_index.get(ref)
+        if index is None and self.lazy and not self.refs_resolved:
+            index = self.find_lazy_row(ref)
+        if index is None:
+            return None
+        return Footprint(self, index)
+
+    def find_lazy_row(self, ref):
+        """ find the table row of the reference by its path, without reading references of the whole board """
+        fp = self.board.FindFootprintByReference(ref)
+        if fp is None:
+            return None
+        for index in self.path_rows.get(tuple(self.get_footprint_path(fp)), []):
+            if self.get_ref(index) == ref:
+                return index
         return None
 
+    @staticmethod
+    def split_reference(ref):
+        """ split reference into designator and number string """
+        designator = ref.rstrip("0123456789")
+        return designator, ref[len(designator):]
+
+    @staticmethod
+    def natural_sort(list_of_strings):
+        return sorted(list_of_strings, key=natural_sort_key)
+
+    def get_designator_index(self):
+        """ get (and build on first call) the designator -> sorted numbers index """
+        if self.designator_index is None:
+            self.resolve_refs()
+            numbered = {}
+            for ref in self.refs:
+                designator, number = self.split_reference(ref)
+                if number:
+                    numbered.setdefault(designator, []).append((int(number), ref))
+            self.designator_index = {}
+            self.designator_duplicates = {}
+            for designator, entries in numbered.items():
+                entries.sort()
+                numbers = []
+                refs = []
+                for number, ref in entries:
+                    if numbers and numbers[-1] == number:
+                        logger.info("Footprints %s and %s have the same number", refs[-1], ref)
+                        self.designator_duplicates.setdefault((designator, number), []).append(ref)
+                        continue
+                    numbers.append(number)
+                    refs.append(ref)
+                offsets = [number - i for i, number in enumerate(numbers)]
+                self.designator_index[designator] = Designator(numbers, refs, offsets)
+        return self.designator_index
+
+    def update_designator_index(self, removed_refs, added_refs):
+        """
+        remove and add references to the designator index, only the affected designators are updated
+        of the footprints with the same number, the index holds the same one as when it is built from scratch
+        """
+        changed = set()
+        for ref in removed_refs:
+            designator, number = self.split_reference(ref)
+            entry = self.designator_index.get(designator)
+            if entry is None or not number:
+                continue
+            duplicates = self.designator_duplicates.get((designator, int(number)))
+            pos = bisect_left(entry.numbers, int(number))
+            if pos < len(entry.refs) and entry.refs[pos] == ref:
+                if duplicates:
+                    # the first of the remaining footprints with the same number takes its place
+                    duplicates.sort()
+                    entry.refs[pos] = duplicates.pop(0)
+                else:
+                    del entry.numbers[pos]
+                    del entry.refs[pos]
+                    changed.add(designator)
+            elif duplicates and ref in duplicates:
+                duplicates.remove(ref)
+            if duplicates is not None and not duplicates:
+                del self.designator_duplicates[(designator, int(number))]
+        for ref in added_refs:
+            designator, number = self.split_reference(ref)
+            if not number:
+                continue
+            entry = self.designator_index.setdefault(designator, Designator([], [], []))
+            pos = bisect_left(entry.numbers, int(number))
+            if pos < len(entry.numbers) and entry.numbers[pos] == int(number):
+                logger.info("Footprints %s and %s have the same number", entry.refs[pos], ref)
+                self.designator_duplicates.setdefault((designator, int(number)), []).append(max(entry.refs[pos], ref))
+                entry.refs[pos] = min(entry.refs[pos], ref)
+                continue
+            entry.numbers.insert(pos, int(number))
+            entry.refs.insert(pos, ref)
+            changed.add(designator)
+        for designator in changed:
+            entry = self.designator_index[designator]
+            if not entry.numbers:
+                del self.designator_index[designator]
+            else:
+                entry.offsets[:] = [number - i for i, number in enumerate(entry.numbers)]
+
     def get_footprints_with_reference_designator(self, ref_des):
-        list_of_footprints = []
-        for fp in self.footprints:
-            index = 0
-            for i in range(len(fp.ref)):
-                if not fp.ref[i].isdigit():
-                    index = i+1
-            fp_des = fp.ref[:index]
-            if fp_des == ref_des:
-                list_of_footprints.append(fp.ref)
-        return list_of_footprints
-
-    def __init__(self, board):
+        entry = self.get_designator_index().get(ref_des)
+        if entry is None:
+            return []
+        return list(entry.refs)
+
+    def get_consecutive_footprints(self, ref):
+        """ get the run of consecutively numbered footprints which contains the footprint """
+        designator, number = self.split_reference(ref)
+        if self.lazy and not self.refs_resolved:
+            # neighbours are looked up one by one, so that references of the whole board are not read
+            if not number or self.get_fp_by_ref(ref) is None:
+                return [ref]
+            run = {int(number): ref}
+            for direction in (-1, 1):
+                neighbour = int(number) + direction
+                while neighbour >= 0 and self.get_fp_by_ref(designator + str(neighbour)) is not None:
+                    run[neighbour] = designator + str(neighbour)
+                    neighbour = neighbour + direction
+            return [run[x] for x in sorted(run)]
+        entry = self.get_designator_index().get(designator)
+        if entry is None or not number:
+            return [ref]
+        pos = bisect_left(entry.numbers, int(number))
+        # footprints with the same number as another one are not in the index
+        if pos == len(entry.numbers) or entry.refs[pos] != ref:
+            return [ref]
+        offset = entry.offsets[pos]
+        start = bisect_left(entry.offsets, offset)
+        stop = bisect_right(entry.offsets, offset, start)
+        return entry.refs[start:stop]
+
+    def get_consecutive_runs(self, ref_des):
+        """ get all runs of consecutively numbered footprints with the reference designator """
+        entry = self.get_designator_index().get(ref_des)
+        if entry is None:
+            return []
+        runs = []
+        start = 0
+        while start < len(entry.offsets):
+            stop = bisect_right(entry.offsets, entry.offsets[start], start)
+            runs.append(entry.refs[start:stop])
+            start = stop
+        return runs
+
+    def get_lockstep_rows(self, reference_footprints):
+        """
+        get rows of footprints numbered in step with reference footprints of different designators
+        (e.g. R101, C101, D101 -> [R101, C101, D101], [R102, C102, D102], ...). Each designator contributes
+        its run of consecutive footprints, rows cover the numbers where all the runs overlap
+        """
+        index = self.get_designator_index()
+        split_references = [self.split_reference(x) for x in reference_footprints]
+        if len({x[0] for x in split_references}) != len(split_references):
+            raise LookupError("Reference footprints have to have different reference designators")
+        runs = []
+        for ref, (designator, number) in zip(reference_footprints, split_references):
+            entry = index.get(designator) if number else None
+            position = bisect_left(entry.numbers, int(number)) if entry is not None else 0
+            if entry is None or position == len(entry.refs) or entry.refs[position] != ref:
+                raise LookupError("Footprint " + ref + " is not numbered")
+            start = bisect_left(entry.offsets, entry.offsets[position])
+            stop = bisect_right(entry.offsets, entry.offsets[position], start)
+            runs.append((entry.refs, position, start, stop))
+        # rows are numbered relative to the row of reference footprints
+        first = max(start - position for refs, position, start, stop in runs)
+        last = min(stop - position for refs, position, start, stop in runs)
+        for ref, (refs, position, start, stop) in zip(reference_footprints, runs):
+            if stop - start != last - first:
+                logger.info("Only %d of %d footprints consecutive to %s are numbered in step with the others",
+                            last - first, stop - start, ref)
+        return [[refs[position + row] for refs, position, start, stop in runs] for row in range(first, last)]
+
+    def get_footprints_in_range(self, ref_des, first, last):
+        """ get footprints with the reference designator numbered from first to last (inclusive) """
+        entry = self.get_designator_index().get(ref_des)
+        if entry is None:
+            return []
+        return entry.refs[bisect_left(entry.numbers, first):bisect_right(entry.numbers, last)]
+
+    def get_reference_gaps(self, ref_des, first=None, last=None):
+        """ get a list of (first, last) number ranges missing from the designator numbering """
+        entry = self.get_designator_index().get(ref_des)
+        if entry is None:
+            return []
+        if first is None:
+            first = entry.numbers[0]
+        if last is None:
+            last = entry.numbers[-1]
+        gaps = []
+        expected = first
+        start = bisect_left(entry.numbers, first)
+        stop = bisect_right(entry.numbers, last)
+        while start < stop:
+            if entry.numbers[start] > expected:
+                gaps.append((expected, entry.numbers[start] - 1))
+            # jump to the end of the current run
+            start = min(bisect_right(entry.offsets, entry.offsets[start], start), stop)
+            expected = entry.numbers[start - 1] + 1
+        if expected <= last:
+            gaps.append((expected, last))
+        return gaps
+
+    def __init__(self, board, lazy=False, scan_file=False):
+        """
+        In lazy mode only footprint paths are read from the board up front, references, sheet names and files
+        are read when they are first needed, so the work is proportional to footprints which are actually used.
+        With scan_file the footprints are read from the saved board file instead, which is faster on large boards,
+        but it can only be used when the board was not changed since it was loaded or saved
+        """
         self.board = board
         self.pcb_filename = os.path.abspath(board.GetFileName())
         self.sch_filename = self.pcb_filename.replace(".kicad_pcb", ".kicad_sch")
         self.project_folder = os.path.dirname(self.pcb_filename)
-
+        self.lazy = lazy
+        # placement plans computed and poses applied in this session
+        self.plan_cache = {}
+        self.applied_poses = {}
+        self.applied_text_sources = {}
+        # signatures of text items of footprints right after they were replicated to
+        self.applied_text_signatures = {}
+
+        self.clear_footprint_table()
+        if lazy:
+            self.scan_board_lazy(board)
+        else:
+            if scan_file:
+                self.dict_of_sheets, records = self.scan_board_file(self.pcb_filename)
+            else:
+                self.dict_of_sheets, records = self.scan_board(board)
+
+            # construct the table of all the footprints
+            for ref, kiid, path in records:
+                self.append_footprint(ref, kiid, path)
+
+    def clear_footprint_table(self):
+        # footprint table is stored column-wise, one entry per footprint in each column
+        self.refs = []
+        self.kiids = []
+        self.fp_id_codes = array('i')
+        self.sheet_path_ids = array('i')
+        # shared tables the columns above point into
+        self.fp_id_table = []
+        self.fp_id_lookup = {}
+        self.sheet_paths = []
+        self.sheet_path_lookup = {}
+        self.ref_index = {}
+        self.designator_index = None
+        # references left out of the designator index because their number is taken, by (designator, number)
+        self.designator_duplicates = {}
+        # pcbnew footprint objects are resolved by KIID only when needed
+        self.fp_proxies = {}
+        # in lazy mode footprint objects and paths are kept, the rest of the columns are filled on first access
+        self.lazy_footprints = []
+        self.paths = []
+        self.path_rows = {}
+        self.sheet_rows = {}
+        self.refs_resolved = False
+        # footprint subsets as bitsets over footprint table rows
+        self.masks = {}
+        self.net_index = None
+
+    def scan_board(self, board):
+        """ get dict_of_sheets and (reference, KIID, path) records of footprints to be considered for placement """
         # construct a list of footprints with all pertinent data
         logger.info('getting a list of all footprints on board')
-        footprints = board.GetFootprints()
-        self.footprints = []
+        entries = []
+        for fp in board.GetFootprints():
+            try:
+                sheet = (fp.GetProperty('Sheetname'), fp.GetProperty('Sheetfile'))
+            except KeyError:
+                sheet = None
+            entries.append((fp.GetReference(), fp.m_Uuid.AsString(), self.get_footprint_path(fp), sheet))
+        return self.get_sheets_and_records(entries)
+
+    def scan_board_file(self, filename, jobs=None):
+        """ scan_board counterpart which reads the saved board file, with footprints scanned in parallel """
+        logger.info('scanning footprints in board file %s', filename)
+        return self.get_sheets_and_records(scan_board_file(filename, jobs))
+
+    def get_sheets_and_records(self, entries):
+        """ get dict_of_sheets and footprint records from (reference, KIID, path, sheet) of all footprints """
+        records = []
 
         # get dict_of_sheets from layout data only (through footprint Sheetfile and Sheetname properties)
-        self.dict_of_sheets = {}
+        dict_of_sheets = {}
         unique_sheet_ids = set()
-        for fp in footprints:
+        for ref, kiid, path, sheet in entries:
             # construct a set of unique sheets from footprint properties
-            path = fp.GetPath().AsString().upper().replace('00000000-0000-0000-0000-0000', '').split("/")
             sheet_path = path[0:-1]
             for x in sheet_path:
                 unique_sheet_ids.add(x)
 
-            sheet_id = self.get_sheet_id(fp)
-            try:
-                sheet_file = fp.GetProperty('Sheetfile')
-                sheet_name = fp.GetProperty('Sheetname')
-            except KeyError:
-                logger.info("Footprint " + fp.GetReference() +
-                            " does not have Sheetfile property, it will not be considered for placement."
-                            " Most likely it is only in layout")
+            sheet_id = path[-2] if len(path) != 1 else None
+            if sheet is None:
+                logger.info("Footprint %s does not have Sheetfile property, it will not be considered for placement."
+                            " Most likely it is only in layout", ref)
                 continue
+            sheet_name, sheet_file = sheet
             # footprint is in the schematics and has Sheetfile property
             if sheet_file and sheet_id:
                 # strip prepending "File: " if existing
-                self.dict_of_sheets[sheet_id] = [sheet_name, sheet_file]
+                dict_of_sheets[sheet_id] = [sheet_name, sheet_file]
             # footprint is in the schematics but has no Sheetfile properties
             elif sheet_id:
-                logger.info("Footprint " + fp.GetReference() + " does not have Sheetfile property")
-                raise LookupError("Footprint " + str(
-                    fp.GetReference()) + " doesn't have Sheetfile and Sheetname properties. "
-                                         "You need to update the layout from schematics")
+                logger.info("Footprint %s does not have Sheetfile property", ref)
+                raise LookupError("Footprint " + str(ref) + " doesn't have Sheetfile and Sheetname properties. "
+                                                            "You need to update the layout from schematics")
             # footprint is on root level
             else:
-                logger.info("Footprint " + fp.GetReference() + " on root level")
+                logger.info("Footprint %s on root level", ref)
+            records.append((ref, kiid, path))
 
         # catch corner cases with nested hierarchy, where some hierarchical pages don't have any footprints
         unique_sheet_ids.remove("")
-        if len(unique_sheet_ids) > len(self.dict_of_sheets):
+        if len(unique_sheet_ids) > len(dict_of_sheets):
             # open root schematics file and parse for other schematics files
             # This might be prone to errors regarding path discovery
             # thus it is used only in corner cases
-            schematic_found = {}
-            self.parse_schematic_files(self.sch_filename, schematic_found)
-            self.dict_of_sheets = schematic_found
+            dict_of_sheets = self.get_schematic_hierarchy()
+        return dict_of_sheets, records
 
-        for fp in footprints:
+    def scan_board_lazy(self, board):
+        """ add footprints to the table with only their paths known """
+        logger.info('getting a list of all footprint paths on board')
+        self.dict_of_sheets = {}
+        for fp in board.GetFootprints():
+            path = self.get_footprint_path(fp)
+            # footprints without sheet properties are left out, the same as in scan_board
             try:
-                sheet_file = fp.GetProperty('Sheetfile')
-                # construct a list of all the footprints
-                mod_named_tuple = Footprint(fp=fp,
-                                            fp_id=self.get_footprint_id(fp),
-                                            sheet_id=self.get_sheet_path(fp)[0],
-                                            filename=self.get_sheet_path(fp)[1],
-                                            ref=fp.GetReference())
-                self.footprints.append(mod_named_tuple)
+                fp.GetProperty('Sheetname')
+                fp.GetProperty('Sheetfile')
             except KeyError:
-                pass
-        pass
+                continue
+            index = len(self.paths)
+            self.lazy_footprints.append(fp)
+            self.paths.append(path)
+            self.refs.append(None)
+            self.kiids.append(None)
+            self.fp_id_codes.append(self.intern_fp_id(path[-1]) if len(path) != 1 else -1)
+            self.sheet_path_ids.append(-1)
+            self.path_rows.setdefault(tuple(path), []).append(index)
+            if len(path) > 2:
+                self.sheet_rows.setdefault(path[-2], []).append(index)
+
+        # catch corner cases with nested hierarchy, where some hierarchical pages don't have any footprints
+        unique_sheet_ids = set()
+        for sheet_path in {tuple(x[0:-1]) for x in self.paths}:
+            unique_sheet_ids.update(sheet_path)
+        unique_sheet_ids.discard("")
+        if not unique_sheet_ids.issubset(self.sheet_rows):
+            self.dict_of_sheets = self.get_schematic_hierarchy()
+
+    def refresh(self, board):
+        """ bring the footprint table up to date with the board, updating only footprints which changed """
+        self.board = board
+        if self.lazy:
+            self.clear_footprint_table()
+            self.scan_board_lazy(board)
+            return
+        # pcbnew objects from previous run might not exist anymore
+        self.fp_proxies = {}
+        self.net_index = None
+        dict_of_sheets, records = self.scan_board(board)
+
+        # sheet names and files are shared between footprints, if they changed everything has to be rebuilt
+        if dict_of_sheets != self.dict_of_sheets:
+            logger.info("Sheets changed, rebuilding footprint table")
+            self.clear_footprint_table()
+            self.dict_of_sheets = dict_of_sheets
+            for ref, kiid, path in records:
+                self.append_footprint(ref, kiid, path)
+            return
+
+        # find the footprints which were added, removed or have changed reference or path
+        to_add = []
+        to_remove = []
+        on_board = set()
+        # KIIDs are indexed only while refreshing, to keep the table small between plugin runs
+        kiid_index = {kiid: index for index, kiid in enumerate(self.kiids)}
+        for ref, kiid, path in records:
+            on_board.add(kiid)
+            index = kiid_index.get(kiid)
+            if index is None:
+                to_add.append((ref, kiid, path))
+            elif not self.footprint_matches(index, ref, path):
+                to_remove.append(index)
+                to_add.append((ref, kiid, path))
+        to_remove.extend(index for kiid, index in kiid_index.items() if kiid not in on_board)
+        logger.info("Refreshing footprint table, removing %d and adding %d footprints", len(to_remove), len(to_add))
+
+        removed_refs = [self.refs[index] for index in to_remove]
+        for ref in removed_refs:
+            self.applied_poses.pop(ref, None)
+            self.applied_text_sources.pop(ref, None)
+            self.applied_text_signatures.pop(ref, None)
+        # remove from the back, so that the rows which are moved into the gaps are not removed later
+        for index in sorted(to_remove, reverse=True):
+            self.remove_footprint(index)
+        for ref, kiid, path in to_add:
+            self.append_footprint(ref, kiid, path)
+        if to_remove or to_add:
+            self.masks = {}
+        if self.designator_index is not None:
+            self.update_designator_index(removed_refs, [x[0] for x in to_add])
+
+    def footprint_matches(self, index, ref, path):
+        """ check if footprint table row has the reference and path """
+        if self.refs[index] != ref:
+            return False
+        fp_id_code = self.fp_id_lookup.get(path[-1], -1) if len(path) != 1 else -1
+        sheet_path_id = self.sheet_path_lookup.get(tuple(path[0:-1]))
+        return self.fp_id_codes[index] == fp_id_code and self.sheet_path_ids[index] == sheet_path_id
+
+    def remove_footprint(self, index):
+        """ remove footprint record from the footprint table, last row is moved in its place """
+        ref = self.refs[index]
+        if self.ref_index.get(ref) == index:
+            del self.ref_index[ref]
+        last = len(self.refs) - 1
+        if index != last:
+            moved_ref = self.refs[last]
+            if self.ref_index.get(moved_ref) == last:
+                self.ref_index[moved_ref] = index
+            self.refs[index] = moved_ref
+            self.kiids[index] = self.kiids[last]
+            self.fp_id_codes[index] = self.fp_id_codes[last]
+            self.sheet_path_ids[index] = self.sheet_path_ids[last]
+        self.refs.pop()
+        self.kiids.pop()
+        self.fp_id_codes.pop()
+        self.sheet_path_ids.pop()
+
+    def get_schematic_hierarchy(self):
+        """ get sheet id -> [sheet name, sheet file] from schematics files, reusing the cache if files are unchanged """
+        cache_filename = os.path.join(self.project_folder, HIERARCHY_CACHE_FILE)
+        try:
+            with open(cache_filename, encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache['version'] == HIERARCHY_CACHE_VERSION and cache['root'] == self.sch_filename:
+                fingerprints = {x: get_file_fingerprint(x, known) for x, known in cache['files'].items()}
+                if all(fingerprints[x][2] == cache['files'][x][2] for x in fingerprints):
+                    logger.info("Reusing schematics hierarchy from %s", cache_filename)
+                    # store refreshed modification times so that next time hashing can be skipped
+                    if fingerprints != cache['files']:
+                        try:
+                            self.save_schematic_hierarchy(cache_filename, cache['sheets'], fingerprints)
+                        except OSError:
+                            logger.info("Could not store schematics hierarchy cache to %s", cache_filename)
+                    return cache['sheets']
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            logger.info("Schematics hierarchy cache %s is missing or not valid", cache_filename)
+
+        dict_of_sheets = {}
+        self.parse_schematic_files(self.sch_filename, dict_of_sheets)
+        try:
+            files = {self.sch_filename} | {x[1] for x in dict_of_sheets.values()}
+            fingerprints = {x: get_file_fingerprint(x) for x in files}
+            self.save_schematic_hierarchy(cache_filename, dict_of_sheets, fingerprints)
+        except OSError:
+            logger.info("Could not store schematics hierarchy cache to %s", cache_filename)
+        return dict_of_sheets
+
+    def save_schematic_hierarchy(self, cache_filename, dict_of_sheets, fingerprints):
+        cache = {'version': HIERARCHY_CACHE_VERSION,
+                 'root': self.sch_filename,
+                 'files': fingerprints,
+                 'sheets': dict_of_sheets}
+        # other processes might be reading the cache, so it is replaced only once it is complete
+        temp_filename = cache_filename + '.' + str(os.getpid())
+        with open(temp_filename, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, separators=(',', ':'))
+        os.replace(temp_filename, cache_filename)
 
     def parse_schematic_files(self, filename, dict_of_sheets):
-        with open(filename, encoding='utf-8') as f:
-            contents = f.read().split("\n")
-        filename_dir = os.path.dirname(filename)
-        # find (sheet (at and then look in next few lines for new schematics file
-        for i in range(len(contents)):
-            line = contents[i]
-            if "(sheet (at" in line:
-                sheetname = ""
-                sheetfile = ""
-                sheet_id = ""
-                sn_found = False
-                sf_found = False
-                for j in range(i, i + 10):
-                    if "(uuid " in contents[j]:
-                        path = contents[j].replace("(uuid ", '').rstrip(")").upper().strip()
-                        sheet_id = path.replace('00000000-0000-0000-0000-0000', '')
-                    if "(property \"Sheet name\"" in contents[j] or "(property \"Sheetname\"" in contents[j]:
-                        sheetname = contents[j].replace("(property \"Sheet name\"", '').split("(")[0].replace("\"","").strip()
-                        sn_found = True
-                    if "(property \"Sheet file\"" in contents[j] or "(property \"Sheetfile\"" in contents[j]:
-                        sheetfile = contents[j].replace("(property \"Sheet file\"", '').split("(")[0].replace("\"","").strip()
-                        sf_found = True
-                # properly handle property not found
-                if not sn_found or not sf_found:
-                    logger.info(f'Did not found sheetfile and/or sheetname properties in the schematic file '
-                                f'in {filename} line:{str(i)}')
-                    raise LookupError(f'Did not found sheetfile and/or sheetname properties in the schematic file '
-                                f'in {filename} line:{str(i)}. Unsupported schematics file format')
-
-                sheetfilepath = os.path.join(filename_dir, sheetfile)
-                # here I should find all sheet data
-                dict_of_sheets[sheet_id] = [sheetname, sheetfilepath]
-                # test if newfound file can be opened
-                if not os.path.exists(sheetfilepath):
-                    raise LookupError(f'File {sheetfilepath} does not exists. This is either due to error in parsing'
-                                      f' schematics files, missing schematics file or an error within the schematics')
-                # open a newfound file and look for nested sheets
-                self.parse_schematic_files(sheetfilepath, dict_of_sheets)
-        return
+        """
+        find all sheets in the hierarchy of schematics file. Distinct sheet files found on each depth of
+        the hierarchy are read concurrently, then the sheets are collected in the same order as if files were
+        read one after another, and the first error in that order is raised
+        """
+        parsed = {}
+        frontier = [filename]
+        with concurrent.futures.ThreadPoolExecutor(SCHEMATIC_READ_THREADS) as executor:
+            while frontier:
+                results = list(executor.map(self.read_schematic_file, frontier))
+                parsed.update(zip(frontier, results))
+                # sheets found before an error are read as well, even though they won't be used
+                new_files = [x[2] for result in results for x in result[1] if x[2] not in parsed]
+                frontier = list(dict.fromkeys(new_files))
+        self.add_schematic_sheets(filename, parsed, dict_of_sheets)
+
+    def add_schematic_sheets(self, filename, parsed, dict_of_sheets):
+        exists, sheets, error = parsed[filename]
+        for sheet_id, sheetname, sheetfilepath in sheets:
+            # here I should find all sheet data
+            dict_of_sheets[sheet_id] = [sheetname, sheetfilepath]
+            # test if newfound file can be opened
+            if not parsed[sheetfilepath][0]:
+                raise LookupError(f'File {sheetfilepath} does not exists. This is either due to error in parsing'
+                                  f' schematics files, missing schematics file or an error within the schematics')
+            # look for nested sheets in the newfound file
+            self.add_schematic_sheets(sheetfilepath, parsed, dict_of_sheets)
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def read_schematic_file(filename):
+        """
+        get (file exists, [(sheet id, sheet name, sheet file path)], error) for schematics file
+        sheets are listed up to the error which stopped reading the file, if there was one
+        """
+        exists = os.path.exists(filename)
+        sheets = []
+        try:
+            with open(filename, encoding='utf-8') as f:
+                contents = f.read().split("\n")
+            filename_dir = os.path.dirname(filename)
+            # find (sheet (at and then look in next few lines for new schematics file
+            for i in range(len(contents)):
+                line = contents[i]
+                if "(sheet (at" in line:
+                    sheetname = ""
+                    sheetfile = ""
+                    sheet_id = ""
+                    sn_found = False
+                    sf_found = False
+                    for j in range(i, i + 10):
+                        if "(uuid " in contents[j]:
+                            path = contents[j].replace("(uuid ", '').rstrip(")").upper().strip()
+                            sheet_id = path.replace('00000000-0000-0000-0000-0000', '')
+                        if "(property \"Sheet name\"" in contents[j] or "(property \"Sheetname\"" in contents[j]:
+                            sheetname = contents[j].replace("(property \"Sheet name\"", '').split("(")[0].replace("\"","").strip()
+                            sn_found = True
+                        if "(property \"Sheet file\"" in contents[j] or "(property \"Sheetfile\"" in contents[j]:
+                            sheetfile = contents[j].replace("(property \"Sheet file\"", '').split("(")[0].replace("\"","").strip()
+                            sf_found = True
+                    # properly handle property not found
+                    if not sn_found or not sf_found:
+                        logger.info('Did not found sheetfile and/or sheetname properties in the schematic file '
+                                    'in %s line:%d', filename, i)
+                        raise LookupError(f'Did not found sheetfile and/or sheetname properties in the schematic file '
+                                    f'in {filename} line:{str(i)}. Unsupported schematics file format')
+
+                    sheets.append((sheet_id, sheetname, os.path.join(filename_dir, sheetfile)))
+        # errors are raised once the sheets are collected in order
+        except (OSError, ValueError, LookupError) as error:
+            return exists, sheets, error
+        return exists, sheets, None
+
+    def get_all_mask(self):
+        return (1 << len(self.fp_id_codes)) - 1
+
+    def get_mask(self, refs):
+        """ get bitset of footprints with given references """
+        return bits_from_indices(self.get_fp_by_ref(x).index for x in refs)
+
+    def get_fp_id_mask(self, fp_id):
+        """ get bitset of footprints with same id """
+        code = self.fp_id_lookup.get(fp_id)
+        if code is None:
+            return 0
+        key = ('fp_id', code)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = bits_from_indices(i for i, x in enumerate(self.fp_id_codes) if x == code)
+            self.masks[key] = mask
+        return mask
+
+    def get_sheet_mask(self, level):
+        """ get bitset of footprints on the level (or bellow it) """
+        level = list(level)
+        key = ('sheet', tuple(level))
+        mask = self.masks.get(key)
+        if mask is None:
+            level_depth = len(level)
+            # footprints share sheet paths, so each one is compared only once
+            matches = {}
+            rows = []
+            for i in range(len(self.sheet_path_ids)):
+                path_id = self.get_sheet_path_id(i)
+                match = matches.get(path_id)
+                if match is None:
+                    match = level == self.sheet_paths[path_id][0][0:level_depth]
+                    matches[path_id] = match
+                if match:
+                    rows.append(i)
+            mask = bits_from_indices(rows)
+            self.masks[key] = mask
+        return mask
+
+    def get_designator_mask(self, ref_des):
+        """ get bitset of footprints with same reference designator """
+        key = ('designator', ref_des)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = self.get_mask(self.get_footprints_with_reference_designator(ref_des))
+            self.masks[key] = mask
+        return mask
+
+    def iter_footprints_in_mask(self, mask):
+        for i in iter_bits(mask):
+            yield Footprint(self, i)
+
+    def get_refs_in_mask(self, mask):
+        return [self.get_ref(i) for i in iter_bits(mask)]
+
+    def iter_footprints_with_same_id(self, fp_id):
+        return self.iter_footprints_in_mask(self.get_fp_id_mask(fp_id))
 
     def get_list_of_footprints_with_same_id(self, fp_id):
-        footprints_with_same_id = []
-        for fp in self.footprints:
-            if fp.fp_id == fp_id:
-                footprints_with_same_id.append(fp)
-        return footprints_with_same_id
+        return list(self.iter_footprints_with_same_id(fp_id))
 
     def get_sheets_to_replicate(self, reference_footprint, level):
         sheet_id = reference_footprint.sheet_id
         sheet_file = reference_footprint.filename
         # find level_id
         level_file = sheet_file[sheet_id.index(level)]
-        logger.info('constructing a list of sheets suitable for replication on level:'
-                    + repr(level) + ", file:" + repr(level_file))
+        logger.info('constructing a list of sheets suitable for replication on level:%r, file:%r', level, level_file)
 
         # construct complete hierarchy path up to the level of reference footprint
         sheet_id_up_to_level = []
@@ -242,13 +1277,11 @@ class Placer:
             if sheet_id[i] == level:
                 break
 
-        # get all footprints with same ID
-        footprints_with_same_id = self.get_list_of_footprints_with_same_id(reference_footprint.fp_id)
         # if hierarchy is deeper, match only the sheets with same hierarchy from root to -1
         sheets_on_same_level = []
 
-        # go through all the footprints
-        for fp in footprints_with_same_id:
+        # go through all the footprints with same ID
+        for fp in self.iter_footprints_with_same_id(reference_footprint.fp_id):
             # if the footprint is on selected level, it's sheet is added to the list of sheets on this level
             if level_file in fp.filename:
                 sheet_id_list = []
@@ -259,32 +1292,39 @@ class Placer:
                         break
                 sheets_on_same_level.append(sheet_id_list)
 
-        # remove duplicates
-        sheets_on_same_level.sort()
-        sheets_on_same_level = list(k for k, _ in itertools.groupby(sheets_on_same_level))
+        # remove duplicates and sort by sheet names
+        sheets_on_same_level = list({tuple(x): x for x in sheets_on_same_level}.values())
+        sheets_on_same_level.sort(key=lambda x: [natural_sort_key(name) for name in x])
 
         # remove the sheet path for reference footprint
         if sheet_id_up_to_level in sheets_on_same_level:
             index = sheets_on_same_level.index(sheet_id_up_to_level)
             del sheets_on_same_level[index]
-        logger.info("suitable sheets are:"+repr(sheets_on_same_level))
+        logger.info("suitable sheets are:%r", sheets_on_same_level)
         return sheets_on_same_level
 
+    def get_sheet_anchors(self, fp_id, sheets):
+        """ get reference of the first footprint with the id on each of the sheets, in one pass over the footprints """
+        lengths = {len(x) for x in sheets}
+        anchors = {}
+        for fp in self.iter_footprints_with_same_id(fp_id):
+            sheet_id = tuple(fp.sheet_id)
+            for length in lengths:
+                anchors.setdefault(sheet_id[0:length], fp.ref)
+        return [anchors[tuple(x)] for x in sheets]
+
+    def iter_footprints_on_sheet(self, level, on_sheet=True):
+        """ iterate over footprints on the level (or bellow it), or over the rest of them if on_sheet is False """
+        mask = self.get_sheet_mask(level)
+        if not on_sheet:
+            mask = self.get_all_mask() & ~mask
+        return self.iter_footprints_in_mask(mask)
+
     def get_footprints_on_sheet(self, level):
-        footprints_on_sheet = []
-        level_depth = len(level)
-        for fp in self.footprints:
-            if level == fp.sheet_id[0:level_depth]:
-                footprints_on_sheet.append(fp)
-        return footprints_on_sheet
+        return list(self.iter_footprints_on_sheet(level))
 
     def get_footprints_not_on_sheet(self, level):
-        footprints_not_on_sheet = []
-        level_depth = len(level)
-        for fp in self.footprints:
-            if level != fp.sheet_id[0:level_depth]:
-                footprints_not_on_sheet.append(fp)
-        return footprints_not_on_sheet
+        return list(self.iter_footprints_on_sheet(level, on_sheet=False))
 
     @staticmethod
     def get_footprints_bounding_box(footprints):
@@ -316,160 +1356,762 @@ class Placer:
         pos_x = (right+left)/2
         return pos_x, pos_y
 
-    def place_circular(self, footprints_to_place, reference_footprint, radius, delta_angle, delta_radius,
-                       step, rotation, copy_text_items):
-        logger.info("Starting placing with circular layout")
-        # get proper footprint list
-        footprints = []
-        for fp in footprints_to_place:
-            footprints.append(self.get_fp_by_ref(fp))
+    def get_pose(self, footprint):
+        """ get current pose of the footprint """
+        position = footprint.fp.GetPosition()
+        return Pose((position.x, position.y), footprint.fp.GetOrientationDegrees(), footprint.fp.IsFlipped())
+
+    def get_text_signature(self, footprint):
+        """ get a tuple describing footprint text items and their replicated properties, to find out if they changed """
+        signature = []
+        for text in self.get_module_text_items(footprint):
+            position = text.GetPosition()
+            signature.append((position.x, position.y, text.GetText()) +
+                             tuple(getattr(text, getter)() for getter, setter in TEXT_PROPERTIES))
+        return tuple(signature)
+
+    def get_cached_plan(self, key):
+        plan = self.plan_cache.pop(key, None)
+        if plan is not None:
+            logger.info("Reusing placement plan computed before")
+            # most recently used plans are kept at the end
+            self.plan_cache[key] = plan
+        return plan
+
+    def store_plan(self, key, plan):
+        self.plan_cache[key] = plan
+        if len(self.plan_cache) > PLAN_CACHE_SIZE:
+            del self.plan_cache[next(iter(self.plan_cache))]
+
+    def apply_plan(self, plan, text_source=None, progress=None):
+        """
+        move footprints to their planned poses in one pass, pose properties which already match are not written
+        KiCad records all changes made within one plugin run as a single undo step
+        Text items are replicated only to footprints whose pose differs from the pose applied last time
+        or whose text items were changed since they were replicated, unless text items of the source footprint changed
+        If progress is given, footprints are moved in chunks and progress(done, total) is called after each one,
+        if it returns False, all footprints are put back where they were and None is returned
+        """
+        if progress is not None:
+            backup = self.get_plan_backup(plan, text_source)
+        changed = []
+
+        def apply_pose(item):
+            fp_ref, pose = item
+            if self.set_pose(self.get_fp_by_ref(fp_ref).fp, pose) or self.applied_poses.get(fp_ref) != pose:
+                changed.append(fp_ref)
+            self.applied_poses[fp_ref] = pose
+        # text items take about as long as the footprints, the total is corrected once it is known
+        total = 2 * len(plan) if text_source is not None else len(plan)
+        if not self.run_in_chunks(plan, apply_pose, progress, 0, total):
+            self.restore_plan_backup(backup)
+            return None
+        logger.info("Moved %d of %d footprints", len(changed), len(plan))
+
+        # text items are replicated once all the footprints are in place
+        if text_source is not None:
+            src_fp = self.get_fp_by_ref(text_source)
+            signature = self.get_text_signature(src_fp)
+            if self.applied_text_sources.get(text_source) != signature:
+                changed = [fp_ref for fp_ref, pose in plan]
+            else:
+                # text items edited by hand since they were replicated are replicated again
+                moved = set(changed)
+                changed = changed + [fp_ref for fp_ref, pose in plan if fp_ref not in moved and
+                                     self.applied_text_signatures.get(fp_ref) !=
+                                     self.get_text_signature(self.get_fp_by_ref(fp_ref))]
+
+            def replicate_texts(fp_ref):
+                dst_fp = self.get_fp_by_ref(fp_ref)
+                self.replicate_fp_text_items(src_fp, dst_fp)
+                self.applied_text_signatures[fp_ref] = self.get_text_signature(dst_fp)
+            if not self.run_in_chunks(changed, replicate_texts, progress, len(plan), len(plan) + len(changed)):
+                self.restore_plan_backup(backup)
+                return None
+            self.applied_text_sources[text_source] = signature
+        return changed
 
-        ref_fp = self.get_fp_by_ref(reference_footprint)
+    @staticmethod
+    def set_pose(footprint, pose):
+        """ set footprint pose, returns True if the footprint had to be moved """
+        modified = False
+        if footprint.IsFlipped() != pose.flipped:
+            footprint.Flip(footprint.GetPosition(), False)
+            modified = True
+        position = footprint.GetPosition()
+        if (position.x, position.y) != pose.position:
+            footprint.SetPosition(pcbnew.wxPoint(*pose.position))
+            modified = True
+        # planned orientation is not normalized, while the one read back from KiCad is
+        if modified or not same_angle(footprint.GetOrientationDegrees(), pose.orientation):
+            footprint.SetOrientationDegrees(pose.orientation)
+            modified = True
+        return modified
 
-        # get first footprint position
-        ref_fp_pos = ref_fp.fp.GetPosition()
-        logger.info("reference footprint position at: " + repr(ref_fp_pos))
-        ref_fp_index = footprints.index(ref_fp)
+    @staticmethod
+    def run_in_chunks(items, function, progress, done, total):
+        """
+        call function for each item, with progress(done, total) called after each chunk of items
+        chunk size is tuned so that a chunk takes about APPLY_CHUNK_TIME, returns False if progress returned False
+        """
+        if progress is None:
+            for item in items:
+                function(item)
+            return True
+        chunk_size = 1
+        start = 0
+        while start < len(items):
+            chunk_start = time.perf_counter()
+            for item in items[start:start + chunk_size]:
+                function(item)
+            start = start + chunk_size
+            if not progress(done + min(start, len(items)), total):
+                logger.info("Placing cancelled after %d of %d steps", done + min(start, len(items)), total)
+                return False
+            # chunks grow at most twice at a time, so that a single slow footprint does not freeze the UI
+            elapsed = max(time.perf_counter() - chunk_start, 1e-6)
+            chunk_size = max(1, min(2 * chunk_size, int(chunk_size * APPLY_CHUNK_TIME / elapsed)))
+        return True
+
+    def get_plan_backup(self, plan, text_source):
+        """ get everything applying the plan can change, so that it can be rolled back """
+        backup = []
+        for fp_ref, pose in plan:
+            footprint = self.get_fp_by_ref(fp_ref)
+            texts = None
+            if text_source is not None:
+                texts = [(x.GetPosition(), [getattr(x, getter)() for getter, setter in TEXT_PROPERTIES])
+                         for x in self.get_module_text_items(footprint)]
+            backup.append((fp_ref, self.get_pose(footprint), self.applied_poses.get(fp_ref), texts))
+        return backup, text_source, self.applied_text_sources.get(text_source)
+
+    def restore_plan_backup(self, backup):
+        footprints, text_source, text_signature = backup
+        for fp_ref, pose, applied_pose, texts in footprints:
+            footprint = self.get_fp_by_ref(fp_ref)
+            self.set_pose(footprint.fp, pose)
+            if texts is not None:
+                self.applied_text_signatures.pop(fp_ref, None)
+                for text, (position, values) in zip(self.get_module_text_items(footprint), texts):
+                    for (getter, setter), value in zip(TEXT_PROPERTIES, values):
+                        getattr(text, setter)(value)
+                    text.SetPosition(position)
+            if applied_pose is None:
+                self.applied_poses.pop(fp_ref, None)
+            else:
+                self.applied_poses[fp_ref] = applied_pose
+        if text_source is not None:
+            if text_signature is None:
+                self.applied_text_sources.pop(text_source, None)
+            else:
+                self.applied_text_sources[text_source] = text_signature
+        logger.info("Footprints were put back where they were")
+
+    def plan_circular(self, footprints_to_place, reference_footprint, radius, delta_angle, delta_radius,
+                      step, rotation):
+        # reference footprint pose is read only once
+        ref_pose = self.get_pose(self.get_fp_by_ref(reference_footprint))
+        key = ('circular', tuple(footprints_to_place), reference_footprint, ref_pose,
+               radius, delta_angle, delta_radius, step, rotation)
+        plan = self.get_cached_plan(key)
+        if plan is not None:
+            return plan
+
+        ref_fp_pos = ref_pose.position
+        logger.info("reference footprint position at: %r", ref_fp_pos)
+        ref_fp_index = footprints_to_place.index(reference_footprint)
 
         point_of_rotation = (ref_fp_pos[0], ref_fp_pos[1] + radius * SCALE)
 
-        logger.info("rotation center at: " + repr(point_of_rotation))
-        for fp in footprints:
-            index = footprints.index(fp)
+        logger.info("rotation center at: %r", point_of_rotation)
+        plan = []
+        for index, fp_ref in enumerate(footprints_to_place):
             delta_index = index - ref_fp_index
 
-            if fp.fp.IsFlipped() != ref_fp.fp.IsFlipped():
-                fp.fp.Flip(fp.fp.GetPosition(), False)
-
-            circular_position = rotate_around_point(ref_fp_pos, point_of_rotation, delta_index * delta_angle)
+            turn = Transform.rotation(delta_index * delta_angle, point_of_rotation)
+            circular_position = turn.apply_point(ref_fp_pos)
             # add delta radius for spirals
-            radial_delta = rotate_around_point([0.0, -pcbnew.Millimeter2iu(delta_radius*delta_index)], [0.0, 0.0], delta_index * delta_angle)
-            new_position = [sum(i) for i in zip(circular_position, radial_delta)]
-            new_position = [int(x) for x in new_position]
-            fp.fp.SetPosition(pcbnew.wxPoint(*new_position))
-            footprint_angle = ref_fp.fp.GetOrientationDegrees()-delta_index*delta_angle
+            radial_delta = turn.apply_vector((0.0, -pcbnew.Millimeter2iu(delta_radius*delta_index)))
+            new_position = (to_iu(circular_position[0] + radial_delta[0]),
+                            to_iu(circular_position[1] + radial_delta[1]))
+            footprint_angle = turn.apply_orientation(ref_pose.orientation)
             footprint_angle = footprint_angle + index // step * rotation
-            fp.fp.SetOrientationDegrees(footprint_angle)
+            plan.append((fp_ref, Pose(new_position, footprint_angle, ref_pose.flipped)))
+        self.store_plan(key, plan)
+        return plan
 
-            if copy_text_items:
-                self.replicate_fp_text_items(ref_fp, fp)
-
-    def place_linear(self, footprints_to_place, reference_footprint, step_x, step_y, step, rotation, copy_text_items):
-        logger.info("Starting placing with linear layout")
-        # get proper footprint list
-        footprints = []
-        for fp in footprints_to_place:
-            footprints.append(self.get_fp_by_ref(fp))
-
-        ref_fp = self.get_fp_by_ref(reference_footprint)
+    def place_circular(self, footprints_to_place, reference_footprint, radius, delta_angle, delta_radius,
+                       step, rotation, copy_text_items, assign_by_connectivity=False, progress=None):
+        logger.info("Starting placing with circular layout")
+        plan = self.plan_circular(footprints_to_place, reference_footprint, radius, delta_angle, delta_radius,
+                                  step, rotation)
+        if assign_by_connectivity:
+            plan = self.assign_slots(plan, reference_footprint)
+        self.apply_plan(plan, reference_footprint if copy_text_items else None, progress)
+
+    def plan_linear(self, footprints_to_place, reference_footprint, step_x, step_y, step, rotation):
+        # reference footprint pose is read only once
+        ref_pose = self.get_pose(self.get_fp_by_ref(reference_footprint))
+        key = ('linear', tuple(footprints_to_place), reference_footprint, ref_pose, step_x, step_y, step, rotation)
+        plan = self.get_cached_plan(key)
+        if plan is not None:
+            return plan
+
+        ref_fp_pos = ref_pose.position
+        ref_fp_index = footprints_to_place.index(reference_footprint)
+
+        plan = []
+        for index, fp_ref in enumerate(footprints_to_place):
+            delta_index = index-ref_fp_index
 
-        # get reference footprint position
-        ref_fp_pos = ref_fp.fp.GetPosition()
-        ref_fp_index = footprints.index(ref_fp)
+            shift = Transform.translation(delta_index*step_x*SCALE, delta_index*step_y * SCALE)
+            new_position = shift.apply_int([ref_fp_pos])[0]
+            footprint_angle = ref_pose.orientation
+            footprint_angle = footprint_angle + index // step * rotation
+            plan.append((fp_ref, Pose(new_position, footprint_angle, ref_pose.flipped)))
+        self.store_plan(key, plan)
+        return plan
 
-        for fp in footprints:
-            index = footprints.index(fp)
-            delta_index = index-ref_fp_index
+    def place_linear(self, footprints_to_place, reference_footprint, step_x, step_y, step, rotation, copy_text_items,
+                     assign_by_connectivity=False, progress=None):
+        logger.info("Starting placing with linear layout")
+        plan = self.plan_linear(footprints_to_place, reference_footprint, step_x, step_y, step, rotation)
+        if assign_by_connectivity:
+            plan = self.assign_slots(plan, reference_footprint)
+        self.apply_plan(plan, reference_footprint if copy_text_items else None, progress)
 
-            if fp.fp.IsFlipped() != ref_fp.fp.IsFlipped():
-                fp.fp.Flip(fp.fp.GetPosition(), False)
+    def plan_matrix(self, footprints_to_place, reference_footprint, step_x, step_y, nr_columns, step, rotation):
+        # reference footprint pose is read only once
+        ref_pose = self.get_pose(self.get_fp_by_ref(reference_footprint))
 
-            new_position = (ref_fp_pos.x + delta_index*step_x*SCALE, ref_fp_pos.y + delta_index*step_y * SCALE)
-            new_position = [int(x) for x in new_position]
-            fp.fp.SetPosition(pcbnew.wxPoint(*new_position))
-            footprint_angle = ref_fp.fp.GetOrientationDegrees()
+        # get first footprint position
+        # TODO - take reference footprint position for start and build matrix around it (before, after)
+        # TODO - would have to split the for loop into two for loops
+        first_pose = self.get_pose(self.get_fp_by_ref(footprints_to_place[0]))
+        key = ('matrix', tuple(footprints_to_place), reference_footprint, ref_pose, first_pose,
+               step_x, step_y, nr_columns, step, rotation)
+        plan = self.get_cached_plan(key)
+        if plan is not None:
+            return plan
+
+        first_fp_pos = first_pose.position
+
+        # first footprint stays where it is
+        plan = [(footprints_to_place[0], first_pose)]
+        for index, fp_ref in enumerate(footprints_to_place[1:], start=1):
+            row = index // nr_columns
+            column = index - row * nr_columns
+            shift = Transform.translation(column * step_x * SCALE, row * step_y * SCALE)
+            new_position = shift.apply_int([first_fp_pos])[0]
+            footprint_angle = ref_pose.orientation
             footprint_angle = footprint_angle + index // step * rotation
-            fp.fp.SetOrientationDegrees(footprint_angle)
-
-            if copy_text_items:
-                self.replicate_fp_text_items(ref_fp, fp)
+            plan.append((fp_ref, Pose(new_position, footprint_angle, first_pose.flipped)))
+        self.store_plan(key, plan)
+        return plan
 
     def place_matrix(self, footprints_to_place, reference_footprint, step_x, step_y, nr_columns, step, rotation,
-                     copy_text_items):
+                     copy_text_items, assign_by_connectivity=False, progress=None):
         logger.info("Starting placing with matrix layout")
-        # get proper footprint list
-        footprints = []
-        for fp in footprints_to_place:
-            footprints.append(self.get_fp_by_ref(fp))
-
+        plan = self.plan_matrix(footprints_to_place, reference_footprint, step_x, step_y, nr_columns, step, rotation)
+        if assign_by_connectivity:
+            # first footprint keeps its place in matrix layout
+            plan = self.assign_slots(plan, footprints_to_place[0])
+        self.apply_plan(plan, reference_footprint if copy_text_items else None, progress)
+
+    def get_sheet_groups(self, footprints_to_place, level_depth):
+        """ get a list of references of all footprints on the same sheet for each of the footprints to place """
+        levels = {}
+        for fp_ref in footprints_to_place:
+            levels.setdefault(tuple(self.get_fp_by_ref(fp_ref).sheet_id[0:level_depth]), [])
+        # footprints share sheet paths, so each one is looked up only once
+        path_levels = {}
+        for i in range(len(self.sheet_path_ids)):
+            path_id = self.get_sheet_path_id(i)
+            if path_id not in path_levels:
+                path_levels[path_id] = tuple(self.sheet_paths[path_id][0][0:level_depth])
+            group = levels.get(path_levels[path_id])
+            if group is not None:
+                group.append(self.get_ref(i))
+        return [levels[tuple(self.get_fp_by_ref(x).sheet_id[0:level_depth])] for x in footprints_to_place]
+
+    def plan_packed(self, footprints_to_place, reference_footprint, groups, spacing, aspect_ratio, step, rotation):
+        """
+        pack bounding boxes of footprint groups into shelves, each footprint to place leads its group
+        groups are given as lists of footprint references, one for each footprint to place
+        Shelves are filled up to the width which gives the packing approximately the requested aspect ratio.
+        The plan holds only the leading footprints, the groups have to be moved with them (see place_packed)
+        """
+        # reference footprint pose is read only once
+        ref_pose = self.get_pose(self.get_fp_by_ref(reference_footprint))
+        poses = [self.get_pose(self.get_fp_by_ref(x)) for x in footprints_to_place]
+        orientations = [ref_pose.orientation + index // step * rotation for index in range(len(footprints_to_place))]
+        boxes = []
+        for group, pose, orientation in zip(groups, poses, orientations):
+            top, bottom, left, right = self.get_footprints_bounding_box([self.get_fp_by_ref(x) for x in group])
+            if not same_angle(pose.orientation, orientation):
+                # group is turned around its leader, so its box is turned along
+                turn = Transform.rotation(pose.orientation - orientation, pose.position)
+                corners = turn.apply_int([(left, top), (right, top), (left, bottom), (right, bottom)])
+                top, bottom = min(y for x, y in corners), max(y for x, y in corners)
+                left, right = min(x for x, y in corners), max(x for x, y in corners)
+            boxes.append((top, bottom, left, right))
+        positions = [x.position for x in poses]
+        key = ('packed', tuple(footprints_to_place), reference_footprint, ref_pose, tuple(boxes), tuple(positions),
+               spacing, aspect_ratio, step, rotation)
+        plan = self.get_cached_plan(key)
+        if plan is not None:
+            return plan
+
+        gap = to_iu(spacing * SCALE)
+        widths = [right - left for top, bottom, left, right in boxes]
+        heights = [bottom - top for top, bottom, left, right in boxes]
+        area = sum((width + gap) * (height + gap) for width, height in zip(widths, heights))
+        shelf_width = max(max(widths), math.sqrt(area * aspect_ratio))
+
+        # next fit with groups sorted by decreasing height
+        slots = [None] * len(boxes)
+        pos_x = pos_y = shelf_height = 0
+        for index in sorted(range(len(boxes)), key=lambda x: -heights[x]):
+            if pos_x > 0 and pos_x + widths[index] > shelf_width:
+                pos_x = 0
+                pos_y = pos_y + shelf_height + gap
+                shelf_height = 0
+            slots[index] = (pos_x, pos_y)
+            pos_x = pos_x + widths[index] + gap
+            shelf_height = max(shelf_height, heights[index])
+        logger.info("Packed %d groups into shelves %r mm wide", len(boxes), shelf_width / SCALE)
+
+        # footprints keep their position within the group, reference footprint stays where it is
+        packed = [(slot[0] + position[0] - box[2], slot[1] + position[1] - box[0])
+                  for slot, position, box in zip(slots, positions, boxes)]
+        ref_fp_index = footprints_to_place.index(reference_footprint)
+        shift = Transform.translation(ref_pose.position[0] - packed[ref_fp_index][0],
+                                      ref_pose.position[1] - packed[ref_fp_index][1])
+        plan = []
+        for fp_ref, new_position, orientation in zip(footprints_to_place, shift.apply_int(packed), orientations):
+            plan.append((fp_ref, Pose(new_position, orientation, ref_pose.flipped)))
+        self.store_plan(key, plan)
+        return plan
+
+    def place_packed(self, footprints_to_place, reference_footprint, groups, spacing, aspect_ratio, step, rotation,
+                     copy_text_items, move_sheets=False, progress=None):
+        """
+        groups are packed by their bounding boxes, so the whole groups are moved,
+        if move_sheets is set also together with their local tracks, vias and zones
+        returns references of footprints which were moved, or None if placing was cancelled
+        """
+        logger.info("Starting placing with packed layout")
+        # groups are turned in place first, so that they are packed by their actual bounding boxes
+        ref_pose = self.get_pose(self.get_fp_by_ref(reference_footprint))
+        turn_plan = []
+        turn_item_moves = []
+        undo_item_moves = []
+        for index, (fp_ref, group) in enumerate(zip(footprints_to_place, groups)):
+            pose = self.get_pose(self.get_fp_by_ref(fp_ref))
+            target = Pose(pose.position, ref_pose.orientation + index // step * rotation, ref_pose.flipped)
+            if pose.flipped != target.flipped or not same_angle(pose.orientation, target.orientation):
+                plan, moves = self.plan_group_moves([(fp_ref, target)], [group], move_sheets)
+                turn_plan.extend(plan)
+                turn_item_moves.extend(moves)
+                undo_item_moves.extend((items, self.get_group_move(target, pose)) for items, move in moves)
+        backup = self.get_plan_backup(turn_plan, None)
+        turned = self.apply_plan(turn_plan)
+        for items, move in turn_item_moves:
+            self.move_items(items, move)
+
+        plan = self.plan_packed(footprints_to_place, reference_footprint, groups, spacing, aspect_ratio, step,
+                                rotation)
+        group_plan, item_moves = self.plan_group_moves(plan, groups, move_sheets)
+        changed = self.apply_plan(group_plan, None, progress)
+        if changed is None:
+            self.restore_plan_backup(backup)
+            for items, move in undo_item_moves:
+                self.move_items(items, move)
+            return None
+        for items, move in item_moves:
+            self.move_items(items, move)
+        if copy_text_items:
+            src_fp = self.get_fp_by_ref(reference_footprint)
+            for fp_ref, pose in plan:
+                if fp_ref != reference_footprint:
+                    self.replicate_fp_text_items(src_fp, self.get_fp_by_ref(fp_ref))
+        return [x for x in turned if x not in changed] + changed
+
+    def plan_layout(self, layout, footprints_to_place, reference_footprint, parameters, level_depth):
+        """ get placement plan for given layout, packed layout packs the sheets level_depth deep """
+        if layout == 'circular':
+            return self.plan_circular(footprints_to_place, reference_footprint, **parameters)
+        if layout == 'linear':
+            return self.plan_linear(footprints_to_place, reference_footprint, **parameters)
+        if layout == 'matrix':
+            return self.plan_matrix(footprints_to_place, reference_footprint, **parameters)
+        if layout == 'packed':
+            groups = self.get_sheet_groups(footprints_to_place, level_depth)
+            return self.plan_packed(footprints_to_place, reference_footprint, groups, **parameters)
+        raise LookupError("Unknown layout: " + repr(layout))
+
+    def place_hierarchical(self, reference_footprint, levels, copy_text_items, move_sheets=False):
+        """
+        place footprints with same id as reference footprint on all hierarchy levels in one run
+        levels are given bottom-up as (layout, parameters) tuples, parameters are the keyword arguments
+        of the matching plan_ method (without groups for packed layout). On each level sheet groups are arranged
+        inside their parent sheet by the first footprint in each group and the rest of the group is moved along with it.
+        If move_sheets is set, all the footprints on the sheets are moved along with their local tracks, vias and zones
+        """
+        logger.info("Starting hierarchical placing on %d levels", len(levels))
         ref_fp = self.get_fp_by_ref(reference_footprint)
+        depth = len(ref_fp.sheet_id)
+        if len(levels) > depth:
+            raise LookupError("Reference footprint is only " + repr(depth) + " levels deep in the hierarchy")
+
+        # bottom level groups hold one footprint each
+        groups = {}
+        for fp in self.iter_footprints_with_same_id(ref_fp.fp_id):
+            if len(fp.sheet_id) == depth:
+                groups[tuple(fp.sheet_id)] = [fp.ref]
+
+        for level, (layout, parameters) in enumerate(levels):
+            parent_depth = depth - level - 1
+            parents = {}
+            for sheet_path in sorted(groups, key=lambda x: [natural_sort_key(name) for name in x]):
+                parents.setdefault(sheet_path[0:parent_depth], []).append(sheet_path)
+
+            level_plan = []
+            item_moves = []
+            for sheet_paths in parents.values():
+                if len(sheet_paths) < 2:
+                    continue
+                # groups are arranged by their first footprint
+                leaders = [groups[x][0] for x in sheet_paths]
+                reference = next((groups[x][0] for x in sheet_paths if reference_footprint in groups[x]), leaders[0])
+                targets = self.plan_layout(layout, leaders, reference, parameters, parent_depth + 1)
+                if move_sheets:
+                    moved = [self.get_refs_in_mask(self.get_sheet_mask(x)) for x in sheet_paths]
+                else:
+                    moved = [groups[x] for x in sheet_paths]
+                plan, moves = self.plan_group_moves(targets, moved, move_sheets)
+                level_plan.extend(plan)
+                item_moves.extend(moves)
+            # lower levels have to be in place before upper levels are planned from the board
+            self.apply_plan(level_plan)
+            for items, move in item_moves:
+                self.move_items(items, move)
+            groups = {parent: [x for sheet_path in sheet_paths for x in groups[sheet_path]]
+                      for parent, sheet_paths in parents.items()}
 
-        # get first footprint position
-        # TODO - take reference footprint position for start and build matrix around it (before, after)
-        # TODO - would have to split the for loop into two for loops
-        first_fp = footprints[0]
-        first_fp_pos = first_fp.fp.GetPosition()
+        if copy_text_items:
+            src_fp = self.get_fp_by_ref(reference_footprint)
+            for group in groups.values():
+                for fp_ref in group:
+                    if fp_ref != reference_footprint:
+                        self.replicate_fp_text_items(src_fp, self.get_fp_by_ref(fp_ref))
 
+    @staticmethod
+    def get_group_move(leader_pose, target):
+        """
+        get transform which moves a group rigidly, so that its leader moves from leader_pose to target
+        if the leader changes side, the group is mirrored around the leader as pcbnew flips footprints
+        """
+        move = Transform.translation(-leader_pose.position[0], -leader_pose.position[1])
+        if leader_pose.flipped != target.flipped:
+            # flipping negates orientations, the rotation which follows turns the leader to the target
+            move = move.then(Transform.flip()).then(Transform.rotation(-leader_pose.orientation - target.orientation))
+        else:
+            move = move.then(Transform.rotation(leader_pose.orientation - target.orientation))
+        return move.then(Transform.translation(target.position[0], target.position[1]))
+
+    def plan_group_moves(self, plan, groups, move_items):
+        """
+        extend the plan of leading footprints to their groups, each group is moved rigidly along with its leader
+        returns the plan and a list of (items, transform) for tracks, vias and zones local to each group
+        """
+        group_plan = []
+        item_moves = []
+        for (leader, target), group in zip(plan, groups):
+            leader_pose = self.get_pose(self.get_fp_by_ref(leader))
+            flip = leader_pose.flipped != target.flipped
+            move = self.get_group_move(leader_pose, target)
+            group_plan.append((leader, target))
+            others = [x for x in group if x != leader]
+            poses = [self.get_pose(self.get_fp_by_ref(x)) for x in others]
+            positions = move.apply_int([x.position for x in poses])
+            for fp_ref, pose, position in zip(others, poses, positions):
+                group_plan.append((fp_ref, Pose(position, move.apply_orientation(pose.orientation),
+                                                pose.flipped != flip)))
+            if move_items:
+                if flip:
+                    logger.info("Group of %s is flipped, its tracks are not moved", leader)
+                else:
+                    item_moves.append((self.get_local_items(group), move))
+        return group_plan, item_moves
+
+    def plan_lockstep(self, layout, reference_footprints, parameters):
+        """
+        get placement plan for footprints numbered in step with reference footprints of different designators
+        footprints with the first designator are placed in the layout and the footprints of other designators
+        in the same row keep the offset they have in the row of reference footprints
+        """
+        rows = self.get_lockstep_rows(reference_footprints)
+        leader = reference_footprints[0]
+        depth = len(self.get_fp_by_ref(leader).sheet_id)
+        targets = dict(self.plan_layout(layout, [row[0] for row in rows], leader, parameters, depth))
+
+        leader_pose = self.get_pose(self.get_fp_by_ref(leader))
+        poses = [self.get_pose(self.get_fp_by_ref(x)) for x in reference_footprints[1:]]
+        plan = []
+        for row in rows:
+            target = targets[row[0]]
+            flip = leader_pose.flipped != target.flipped
+            move = self.get_group_move(leader_pose, target)
+            plan.append((row[0], target))
+            positions = move.apply_int([x.position for x in poses])
+            for fp_ref, pose, position in zip(row[1:], poses, positions):
+                plan.append((fp_ref, Pose(position, move.apply_orientation(pose.orientation), pose.flipped != flip)))
+        return plan
+
+    def place_lockstep(self, layout, reference_footprints, parameters, copy_text_items):
+        """
+        place footprints of all designators in one pass, parameters are keyword arguments of the plan_ method
+        returns references of footprints which were moved
+        """
+        logger.info("Starting placing of %r in lockstep with %s layout", reference_footprints, layout)
+        plan = self.plan_lockstep(layout, reference_footprints, parameters)
+        changed = self.apply_plan(plan)
         if copy_text_items:
-            self.replicate_fp_text_items(ref_fp, first_fp)
+            designators = {self.split_reference(x)[0]: self.get_fp_by_ref(x) for x in reference_footprints}
+            for fp_ref, pose in plan:
+                src_fp = designators[self.split_reference(fp_ref)[0]]
+                if fp_ref != src_fp.ref:
+                    self.replicate_fp_text_items(src_fp, self.get_fp_by_ref(fp_ref))
+        return changed
+
+    def get_net_index(self):
+        """
+        get net code -> references of footprints with pads on the net and net code -> tracks, vias and zones
+        the index is built once per board
+        """
+        if self.net_index is None:
+            owners = {}
+            for footprint in self.board.GetFootprints():
+                ref = footprint.GetReference()
+                for pad in footprint.Pads():
+                    owners.setdefault(pad.GetNetCode(), set()).add(ref)
+            items = {}
+            for item in self.board.GetTracks():
+                items.setdefault(item.GetNetCode(), []).append(item)
+            for zone in self.board.Zones():
+                items.setdefault(zone.GetNetCode(), []).append(zone)
+            self.net_index = (owners, items)
+        return self.net_index
+
+    def get_local_items(self, footprints):
+        """ get tracks, vias and zones on nets which connect only to pads of given footprints """
+        owners, items = self.get_net_index()
+        footprints = set(footprints)
+        nets = set()
+        for fp_ref in footprints:
+            for pad in self.get_fp_by_ref(fp_ref).fp.Pads():
+                nets.add(pad.GetNetCode())
+        # net 0 holds unconnected items
+        nets.discard(0)
+        return [item for net in nets if owners[net] <= footprints for item in items.get(net, [])]
 
-        for fp in footprints[1:]:
-            if fp.fp.IsFlipped() != first_fp.fp.IsFlipped():
-                fp.fp.Flip(fp.fp.GetPosition(), False)
+    @staticmethod
+    def move_items(items, transform):
+        """ move tracks, vias and zones the same way as the transform moves footprints """
+        # pcbnew rotates in tenths of degree, with angle of opposite sign
+        angle = -transform.angle * 10
+        center = pcbnew.wxPoint(to_iu(transform.origin[0]), to_iu(transform.origin[1]))
+        shift = pcbnew.wxPoint(to_iu(transform.offset[0] - transform.origin[0]),
+                               to_iu(transform.offset[1] - transform.origin[1]))
+        for item in items:
+            if angle % 3600:
+                item.Rotate(center, angle)
+            item.Move(shift)
+
+    def get_sheet_instances(self, fp_ids):
+        """ get fp_id -> list of footprint table rows with that id, ordered by their sheet names """
+        codes = {self.fp_id_lookup[x]: x for x in fp_ids if x in self.fp_id_lookup}
+        instances = {}
+        for i, code in enumerate(self.fp_id_codes):
+            fp_id = codes.get(code)
+            if fp_id is not None:
+                instances.setdefault(fp_id, []).append(i)
+        for rows in instances.values():
+            rows.sort(key=lambda x: [natural_sort_key(name)
+                                     for name in self.sheet_paths[self.get_sheet_path_id(x)][0]])
+        return instances
+
+    def save_template(self, filename, footprints, reference_footprint):
+        """
+        save current placement of footprints as a template, footprint poses are stored relative
+        to the reference footprint and footprints are identified by their id and order of their sheet instance
+        """
+        fps = [self.get_fp_by_ref(x) for x in footprints]
+        fps = [x for x in fps if x.fp_id is not None]
+        instances = self.get_sheet_instances({x.fp_id for x in fps})
+        instance_order = {row: order for rows in instances.values() for order, row in enumerate(rows)}
 
-            index = footprints.index(fp)
-            row = index // nr_columns
-            column = index - row * nr_columns
-            new_pos_x = first_fp_pos.x + column * step_x * SCALE
-            new_pos_y = first_fp_pos.y + row * step_y * SCALE
-            new_position = (new_pos_x, new_pos_y)
-            new_position = [int(x) for x in new_position]
-            fp.fp.SetPosition(pcbnew.wxPoint(*new_position))
-            footprint_angle = ref_fp.fp.GetOrientationDegrees()
-            footprint_angle = footprint_angle + index // step * rotation
-            fp.fp.SetOrientationDegrees(footprint_angle)
+        ref_fp = self.get_fp_by_ref(reference_footprint)
+        ref_pose = self.get_pose(ref_fp)
+        # to the coordinate system of the reference footprint
+        to_template = Transform.translation(-ref_pose.position[0], -ref_pose.position[1]).then(
+            Transform.rotation(ref_pose.orientation))
+        poses = [self.get_pose(x) for x in fps]
+        positions = to_template.apply_int([x.position for x in poses])
+        entries = []
+        for fp, pose, position in zip(fps, poses, positions):
+            entries.append([fp.fp_id, instance_order[fp.index], position[0], position[1],
+                            pose.orientation - ref_pose.orientation, pose.flipped != ref_pose.flipped])
+        template = {'version': TEMPLATE_VERSION,
+                    'reference': [ref_fp.fp_id, instance_order.get(ref_fp.index), ref_pose.flipped],
+                    'footprints': entries}
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(template, f, separators=(',', ':'))
+        logger.info("Saved template with %d footprints to %s", len(entries), filename)
+
+    def plan_template(self, filename, reference_footprint):
+        """
+        get placement plan from a template saved with save_template, anchored on reference footprint
+        templates are used only through this API, the plugin dialogs and the daemon do not offer them
+        """
+        with open(filename, encoding='utf-8') as f:
+            template = json.load(f)
+        if template.get('version') != TEMPLATE_VERSION:
+            raise LookupError("Template " + filename + " was saved with an unsupported version of the plugin")
 
-            if copy_text_items:
-                self.replicate_fp_text_items(ref_fp, fp)
+        ref_fp = self.get_fp_by_ref(reference_footprint)
+        saved_id, saved_order, saved_flipped = template['reference']
+        if ref_fp.fp_id != saved_id:
+            raise LookupError("Template " + filename + " was not saved for footprints with the same id as "
+                              + reference_footprint)
+        instances = self.get_sheet_instances({x[0] for x in template['footprints']} | {saved_id})
+        # footprints are matched by their sheet instance, so the anchor has to be the saved reference footprint
+        ref_rows = instances.get(saved_id, [])
+        if saved_order is not None and (saved_order >= len(ref_rows) or ref_rows[saved_order] != ref_fp.index):
+            expected = self.get_ref(ref_rows[saved_order]) if saved_order < len(ref_rows) else None
+            raise LookupError("Template " + filename + " has to be anchored on the footprint it was saved for ("
+                              + str(expected) + "), not on " + reference_footprint)
+        ref_pose = self.get_pose(ref_fp)
+        matched = []
+        for fp_id, order, pos_x, pos_y, orientation, flipped in template['footprints']:
+            rows = instances.get(fp_id, [])
+            if order < len(rows):
+                matched.append((self.get_ref(rows[order]), (pos_x, pos_y), orientation, flipped))
+        if len(matched) != len(template['footprints']):
+            logger.info("%d footprints from template are not on the board", len(template['footprints']) - len(matched))
+
+        # all positions are transformed to the board in one pass
+        if ref_pose.flipped != saved_flipped:
+            # anchor is on the other side, mirror the template as pcbnew flips footprints (orientation is negated)
+            to_board = Transform.rotation(ref_pose.orientation).then(Transform.flip())
+        else:
+            to_board = Transform.rotation(-ref_pose.orientation)
+        to_board = to_board.then(Transform.translation(ref_pose.position[0], ref_pose.position[1]))
+        positions = to_board.apply_int([x[1] for x in matched])
+        return [(fp_ref, Pose(position, to_board.apply_orientation(orientation), ref_pose.flipped != flipped))
+                for (fp_ref, _, orientation, flipped), position in zip(matched, positions)]
+
+    def place_template(self, filename, reference_footprint, copy_text_items):
+        logger.info("Starting placing from template %s", filename)
+        plan = self.plan_template(filename, reference_footprint)
+        self.apply_plan(plan, reference_footprint if copy_text_items else None)
+
+    def get_slot_costs(self, footprints, slots):
+        """
+        get matrix of connection lengths of each footprint (row) when moved to each slot (column)
+        connections are measured to the centers of pads on the same net on footprints which are not moved
+        """
+        moved = set(footprints)
+        # pad offsets relative to footprint position, for each footprint
+        own_pads = []
+        nets = set()
+        for fp_ref in footprints:
+            footprint = self.get_fp_by_ref(fp_ref).fp
+            position = footprint.GetPosition()
+            pads = []
+            for pad in footprint.Pads():
+                net = pad.GetNetCode()
+                if net > 0:
+                    pad_position = pad.GetPosition()
+                    pads.append((net, pad_position.x - position.x, pad_position.y - position.y))
+                    nets.add(net)
+            own_pads.append((footprint.GetOrientationDegrees(), pads))
+
+        # connectivity of the rest of the board is read in one pass
+        net_pads = {}
+        for footprint in self.board.GetFootprints():
+            if footprint.GetReference() in moved:
+                continue
+            for pad in footprint.Pads():
+                net = pad.GetNetCode()
+                if net in nets:
+                    pad_position = pad.GetPosition()
+                    net_pads.setdefault(net, []).append((pad_position.x, pad_position.y))
+        targets = {net: (sum(x[0] for x in pads) / len(pads), sum(x[1] for x in pads) / len(pads))
+                   for net, pads in net_pads.items() if len(pads) <= ASSIGNMENT_MAX_NET_PADS}
+
+        cost = []
+        for orientation, pads in own_pads:
+            pads = [x for x in pads if x[0] in targets]
+            turned = {}
+            row = []
+            for slot in slots:
+                # pads turn along with the footprint when the slot orientation differs
+                offsets = turned.get(slot.orientation)
+                if offsets is None:
+                    turn = Transform.rotation(orientation - slot.orientation)
+                    offsets = [(targets[net], turn.apply_vector((pos_x, pos_y))) for net, pos_x, pos_y in pads]
+                    turned[slot.orientation] = offsets
+                slot_x, slot_y = slot.position
+                row.append(sum(math.hypot(slot_x + offset[0] - target[0], slot_y + offset[1] - target[1])
+                               for target, offset in offsets))
+            cost.append(row)
+        return cost
+
+    def assign_slots(self, plan, reference_footprint=None):
+        """
+        reassign footprints to the slots of the plan, so that the total length of their connections is minimal
+        reference footprint keeps its slot
+        """
+        fixed = [x for x in plan if x[0] == reference_footprint]
+        free = [x for x in plan if x[0] != reference_footprint]
+        footprints = [x[0] for x in free]
+        slots = [x[1] for x in free]
+        cost = self.get_slot_costs(footprints, slots)
+        assignment = solve_slot_assignment(cost)
+        before = sum(cost[i][i] for i in range(len(free)))
+        after = sum(cost[i][assignment[i]] for i in range(len(free)))
+        logger.info("Slot assignment changed connection length from %.3f mm to %.3f mm", before / SCALE, after / SCALE)
+        return fixed + [(fp_ref, slots[column]) for fp_ref, column in zip(footprints, assignment)]
 
     def replicate_fp_text_items(self, src_fp, dst_fp):
         dst_anchor_fp_position = dst_fp.fp.GetPosition()
         angle = src_fp.fp.GetOrientationDegrees() - dst_fp.fp.GetOrientationDegrees()
 
         delta_pos = dst_anchor_fp_position - src_fp.fp.GetPosition()
+        # move to the destination footprint and rotate around its anchor
+        transform = Transform.translation(delta_pos[0], delta_pos[1]).then(
+            Transform.rotation(angle, dst_anchor_fp_position))
 
         src_fp_text_items = self.get_module_text_items(src_fp)
         dst_fp_text_items = self.get_module_text_items(dst_fp)
         # check if both modules (source and the one for replication) have the same number of text items
         if len(src_fp_text_items) != len(dst_fp_text_items):
             raise LookupError(
-                "Source module: " + src_fp + " has different number of text items (" + repr(len(src_fp_text_items))
+                "Source module: " + src_fp.ref + " has different number of text items (" + repr(len(src_fp_text_items))
                 + ")\nthan module for replication: " + dst_fp.ref + " (" + repr(len(dst_fp_text_items)) + ")")
-        # replicate each text item
-        for src_text in src_fp_text_items:
+        # all text positions are transformed in one go
+        src_positions = [src_text.GetPosition() for src_text in src_fp_text_items]
+        new_positions = transform.apply_int([(x[0], x[1]) for x in src_positions])
+        # replicate each text item, with the same properties as kept in plan backups
+        for src_text, dst_text, position in zip(src_fp_text_items, dst_fp_text_items, new_positions):
             if src_text.IsKeepUpright() and angle != 0.0:
-                logger.info("Text of: " + src_fp.ref +
-                            " has property \"Keep upright\" rotation might not look as intended")
-
-            index = src_fp_text_items.index(src_text)
-            src_text_position = src_text.GetPosition() + delta_pos
-
-            new_position = rotate_around_point(src_text_position, dst_anchor_fp_position, angle)
-
-            # convert to tuple of integers
-            new_position = [int(x) for x in new_position]
-            dst_fp_text_items[index].SetPosition(pcbnew.wxPoint(*new_position))
-
-            # set layer
-            dst_fp_text_items[index].SetLayer(src_text.GetLayer())
-            # set orientation
-            dst_fp_text_items[index].SetTextAngle(src_text.GetTextAngle())
-            # thickness
-            dst_fp_text_items[index].SetTextThickness(src_text.GetTextThickness())
-            # width
-            dst_fp_text_items[index].SetTextWidth(src_text.GetTextWidth())
-            # height
-            dst_fp_text_items[index].SetTextHeight(src_text.GetTextHeight())
-            # rest of the parameters
-            dst_fp_text_items[index].SetItalic(src_text.IsItalic())
-            dst_fp_text_items[index].SetBold(src_text.IsBold())
-            dst_fp_text_items[index].SetMirrored(src_text.IsMirrored())
-            dst_fp_text_items[index].SetMultilineAllowed(src_text.IsMultilineAllowed())
-            dst_fp_text_items[index].SetHorizJustify(src_text.GetHorizJustify())
-            dst_fp_text_items[index].SetVertJustify(src_text.GetVertJustify())
-            dst_fp_text_items[index].SetKeepUpright(src_text.IsKeepUpright())
-            # set visibility
-            dst_fp_text_items[index].SetVisible(src_text.IsVisible())
+                logger.info("Text of: %s has property \"Keep upright\" rotation might not look as intended", src_fp.ref)
+
+            dst_text.SetPosition(pcbnew.wxPoint(*position))
+            for getter, setter in TEXT_PROPERTIES:
+                getattr(dst_text, setter)(getattr(src_text, getter)())
 
     @staticmethod
     def get_module_text_items(footprint):
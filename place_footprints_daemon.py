@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#  place_footprints_daemon.py
+#
+# Copyright (C) 2022 Mitja Nemec
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+Long running placement process for scripted flows. Boards are loaded on first use and kept,
+together with their Placer, in a LRU cache. Requests are JSON-RPC 2.0 objects, one per line,
+read from stdin (or from a local TCP socket with --port) and answered in the same way.
+
+Example request:
+{"jsonrpc": "2.0", "id": 1, "method": "place", "params": {"board": "board.kicad_pcb", "layout": "linear",
+ "footprints": ["R201", "R202"], "reference": "R201",
+ "parameters": {"step_x": 5.0, "step_y": 0.0, "step": 1, "rotation": 0}}}
+"""
+import pcbnew
+from collections import OrderedDict
+import argparse
+import inspect
+import socketserver
+import io
+import logging
+import json
+import sys
+import os
+from place_footprints import Placer, get_board_footprint_hashes, get_changed_footprints
+
+# number of boards kept loaded
+BOARD_CACHE_SIZE = 4
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+PLACEMENT_ERROR = -32000
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidParams(ValueError):
+    """ raised for parameters which bind to the method, but can not be used together """
+
+
+class PlacementServer:
+    def __init__(self, cache_size=BOARD_CACHE_SIZE):
+        self.cache_size = cache_size
+        # filename -> [board, placer, mtime of the file and footprint hashes when it was loaded or saved]
+        self.boards = OrderedDict()
+        self.running = True
+        self.methods = {'load': self.load,
+                        'footprints_with_same_id': self.footprints_with_same_id,
+                        'consecutive_footprints': self.consecutive_footprints,
+                        'sheets_to_replicate': self.sheets_to_replicate,
+                        'place': self.place,
+                        'place_lockstep': self.place_lockstep,
+                        'changed_footprints': self.changed_footprints,
+                        'save': self.save,
+                        'close': self.close,
+                        'shutdown': self.shutdown}
+
+    @staticmethod
+    def get_unsaved_footprints(entry):
+        """ get references of footprints placed on the cached board since it was loaded or saved """
+        return get_changed_footprints(entry[3], get_board_footprint_hashes(entry[0]))
+
+    def get_placer(self, board):
+        """
+        get Placer of the board file, the board is (re)loaded if it is not cached or the file changed
+        boards with unsaved placement are neither reloaded nor dropped from the cache
+        """
+        filename = os.path.abspath(board)
+        entry = self.boards.get(filename)
+        mtime = os.stat(filename).st_mtime_ns
+        if entry is not None and entry[2] != mtime:
+            unsaved = self.get_unsaved_footprints(entry)
+            if unsaved:
+                raise LookupError("Board " + filename + " changed on disk, but placement of " + ", ".join(unsaved) +
+                                  " is not saved. Save the board to another file or close it first")
+        if entry is None or entry[2] != mtime:
+            logger.info("Loading board %s", filename)
+            loaded = pcbnew.LoadBoard(filename)
+            # the board was just loaded, so footprints can be scanned from its file
+            entry = [loaded, Placer(loaded, scan_file=True), mtime, get_board_footprint_hashes(loaded)]
+        # most recently used boards are kept at the end
+        self.boards.pop(filename, None)
+        self.boards[filename] = entry
+        if len(self.boards) > self.cache_size:
+            self.evict_board()
+        return entry[1]
+
+    def evict_board(self):
+        """ drop the least recently used board without unsaved placement """
+        for filename, entry in list(self.boards.items())[:-1]:
+            if not self.get_unsaved_footprints(entry):
+                logger.info("Dropping board %s from the cache", filename)
+                del self.boards[filename]
+                return
+        logger.warning("All %d cached boards have unsaved placement, none of them is dropped", len(self.boards))
+
+    def load(self, board):
+        placer = self.get_placer(board)
+        return len(placer.refs)
+
+    def footprints_with_same_id(self, board, reference):
+        placer = self.get_placer(board)
+        fp_id = placer.get_fp_by_ref(reference).fp_id
+        return placer.natural_sort(x.ref for x in placer.iter_footprints_with_same_id(fp_id))
+
+    def consecutive_footprints(self, board, reference):
+        return self.get_placer(board).get_consecutive_footprints(reference)
+
+    def sheets_to_replicate(self, board, reference, level):
+        placer = self.get_placer(board)
+        return placer.get_sheets_to_replicate(placer.get_fp_by_ref(reference), level)
+
+    def place(self, board, layout, footprints, reference, parameters, copy_text_items=False, level_depth=None,
+              assign_by_connectivity=False):
+        if layout == 'packed' and assign_by_connectivity:
+            raise InvalidParams("Packed layout moves whole sheets, it can not be assigned by connectivity")
+        if layout != 'packed' and level_depth is not None:
+            raise InvalidParams("Only packed layout takes level_depth")
+        placer = self.get_placer(board)
+        if level_depth is None:
+            level_depth = len(placer.get_fp_by_ref(reference).sheet_id)
+        if layout == 'packed':
+            # whole sheets are packed, so they have to be moved along with the footprints
+            groups = placer.get_sheet_groups(footprints, level_depth)
+            return placer.place_packed(footprints, reference, groups, copy_text_items=copy_text_items, **parameters)
+        plan = placer.plan_layout(layout, footprints, reference, parameters, level_depth)
+        if assign_by_connectivity:
+            plan = placer.assign_slots(plan, reference)
+        return placer.apply_plan(plan, reference if copy_text_items else None)
+
+    def place_lockstep(self, board, layout, references, parameters, copy_text_items=False):
+        return self.get_placer(board).place_lockstep(layout, references, parameters, copy_text_items)
+
+    def changed_footprints(self, board):
+        """ get references of footprints changed since the board was loaded or last saved """
+        placer = self.get_placer(board)
+        return get_changed_footprints(self.boards[os.path.abspath(board)][3], get_board_footprint_hashes(placer.board))
+
+    def save(self, board, filename=None):
+        source = os.path.abspath(board)
+        filename = source if filename is None else os.path.abspath(filename)
+        if filename != source and source in self.boards:
+            # unsaved placement can be saved to another file, even if the board file changed on disk
+            placer = self.boards[source][1]
+        else:
+            placer = self.get_placer(source)
+        hashes = get_board_footprint_hashes(placer.board)
+        if filename == source:
+            # placing only changes footprints (and their local tracks), so unchanged board does not have to be saved
+            if not get_changed_footprints(self.boards[source][3], hashes):
+                logger.info("Board %s did not change, it is not saved", filename)
+                return filename
+        pcbnew.SaveBoard(filename, placer.board)
+        if filename == source:
+            # saved board is up to date with its file
+            self.boards[source][2] = os.stat(source).st_mtime_ns
+            self.boards[source][3] = hashes
+        return filename
+
+    def close(self, board):
+        return self.boards.pop(os.path.abspath(board), None) is not None
+
+    def shutdown(self):
+        self.running = False
+        return True
+
+    def handle_request(self, line):
+        """ handle one JSON-RPC request, the response is returned as a dict or None for notifications """
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': str(error)}}
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': INVALID_REQUEST, 'message': "Invalid request"}}
+
+        request_id = request.get('id')
+        method = self.methods.get(request['method'])
+        params = request.get('params', {})
+        if method is None:
+            error = {'code': METHOD_NOT_FOUND, 'message': "Unknown method: " + request['method']}
+        else:
+            # only parameters which do not match the method signature are invalid, errors raised while
+            # placing (TypeError included) are placement errors
+            try:
+                if isinstance(params, list):
+                    arguments = inspect.signature(method).bind(*params)
+                else:
+                    arguments = inspect.signature(method).bind(**params)
+            except TypeError as e:
+                error = {'code': INVALID_PARAMS, 'message': str(e)}
+            else:
+                try:
+                    result = method(*arguments.args, **arguments.kwargs)
+                except InvalidParams as e:
+                    error = {'code': INVALID_PARAMS, 'message': str(e)}
+                except Exception as e:
+                    logger.exception("Error when handling %s request", request['method'])
+                    error = {'code': PLACEMENT_ERROR, 'message': str(e)}
+                else:
+                    error = None
+        if 'id' not in request:
+            return None
+        if error is not None:
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': error}
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    def serve(self, reader, writer):
+        """ answer requests read line by line until shutdown or end of input """
+        for line in reader:
+            if not line.strip():
+                continue
+            response = self.handle_request(line)
+            if response is not None:
+                writer.write(json.dumps(response, separators=(',', ':')) + "\n")
+                writer.flush()
+            if not self.running:
+                break
+
+
+def serve_socket(server, port):
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            server.serve(io.TextIOWrapper(self.rfile, encoding='utf-8'),
+                         io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True))
+
+    # boards are not shared between threads, so connections are handled one at a time
+    with socketserver.TCPServer(('127.0.0.1', port), RequestHandler) as tcp_server:
+        logger.info("Listening on port %d", port)
+        while server.running:
+            tcp_server.handle_request()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Place footprints daemon")
+    parser.add_argument('--port', type=int, help="listen on a local TCP port instead of stdin/stdout")
+    parser.add_argument('--cache-size', type=int, default=BOARD_CACHE_SIZE, help="number of boards kept loaded")
+    args = parser.parse_args()
+
+    # stdout is used for responses
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s %(name)s %(lineno)d:%(message)s',
+                        datefmt='%m-%d %H:%M:%S')
+
+    server = PlacementServer(args.cache_size)
+    if args.port is None:
+        server.serve(sys.stdin, sys.stdout)
+    else:
+        serve_socket(server, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+#  place_footprints_dialogs.py
+#
+# Copyright (C) 2022 Mitja Nemec
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+
+import wx
+import pcbnew
+import math
+import time
+from .initial_dialog_GUI import InitialDialogGUI
+from .place_by_reference_GUI import PlaceByReferenceGUI
+from .place_by_sheet_GUI import PlaceBySheetGUI
+from .error_dialog_GUI import ErrorDialogGUI
+from .place_footprints import iter_bits, bits_from_indices
+
+# progress dialog is shown only when placing takes longer than this (in seconds)
+PROGRESS_DELAY = 0.5
+
+
+def fp_set_highlight(fp):
+    pads_list = fp.Pads()
+    for pad in pads_list:
+        pad.SetBrightened()
+    drawings = fp.GraphicalItems()
+    for item in drawings:
+        item.SetBrightened()
+
+
+def fp_clear_highlight(fp):
+    pads_list = fp.Pads()
+    for pad in pads_list:
+        pad.ClearBrightened()
+    drawings = fp.GraphicalItems()
+    for item in drawings:
+        item.ClearBrightened()
+
+
+class VirtualList(wx.ListCtrl):
+    """
+    list control which asks only for the text of the rows being shown
+    selection is mirrored in a bitset, which is updated from each selection event, and the handler
+    is called with bitsets of newly selected and deselected rows only when the selection changed
+    """
+    def __init__(self, parent):
+        super(VirtualList, self).__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_NO_HEADER)
+        self.InsertColumn(0, "")
+        self.get_item_text = None
+        self.selection = 0
+        self.handler = None
+        self.Bind(wx.EVT_SIZE, self.on_size)
+        self.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_selection_event)
+        self.Bind(wx.EVT_LIST_ITEM_DESELECTED, self.on_selection_event)
+
+    @classmethod
+    def replace(cls, list_box, handler):
+        """ put a virtual list in place of list box generated by wxFormBuilder """
+        virtual_list = cls(list_box.GetParent())
+        virtual_list.SetMinSize(list_box.GetMinSize())
+        list_box.GetContainingSizer().Replace(list_box, virtual_list)
+        list_box.Destroy()
+        virtual_list.handler = handler
+        virtual_list.GetParent().Layout()
+        return virtual_list
+
+    def on_selection_event(self, event):
+        index = event.GetIndex()
+        if index < 0:
+            # changes of many rows at once (deselecting all) are not reported row by row
+            selected, deselected = self.update_selection()
+        elif event.GetEventType() == wx.wxEVT_LIST_ITEM_SELECTED:
+            selected, deselected = (1 << index) & ~self.selection, 0
+            self.selection = self.selection | (1 << index)
+        else:
+            selected, deselected = 0, (1 << index) & self.selection
+            self.selection = self.selection & ~(1 << index)
+        if (selected or deselected) and self.handler is not None:
+            self.handler(selected, deselected)
+
+    def on_size(self, event):
+        self.SetColumnWidth(0, self.GetClientSize().GetWidth())
+        event.Skip()
+
+    def OnGetItemText(self, item, column):
+        return self.get_item_text(item)
+
+    def set_items(self, count, get_item_text):
+        self.deselect_all()
+        self.get_item_text = get_item_text
+        self.SetItemCount(count)
+        self.Refresh()
+
+    # bitset is updated before the control, so that selection events raised meanwhile see no change
+    # and are handled in constant time
+    def select_all(self):
+        self.selection = (1 << self.GetItemCount()) - 1
+        # item -1 stands for all items
+        self.SetItemState(-1, wx.LIST_STATE_SELECTED, wx.LIST_STATE_SELECTED)
+
+    def deselect_all(self):
+        self.selection = 0
+        self.SetItemState(-1, 0, wx.LIST_STATE_SELECTED)
+
+    def select(self, indices):
+        selection = bits_from_indices(indices)
+        if selection == (1 << self.GetItemCount()) - 1:
+            self.select_all()
+            return
+        self.selection = self.selection | selection
+        # wx has no call to select a range of rows, rows are set one by one without a selection event being handled
+        for index in iter_bits(selection):
+            self.SetItemState(index, wx.LIST_STATE_SELECTED, wx.LIST_STATE_SELECTED)
+
+    def update_selection(self):
+        """
+        read selection from the control and return bitsets of newly selected and deselected rows
+        it walks all the selected rows, so it is used only when the selection events do not tell which rows changed
+        """
+        selection = 0
+        item = self.GetFirstSelected()
+        while item != -1:
+            selection = selection | (1 << item)
+            item = self.GetNextSelected(item)
+        changed = selection ^ self.selection
+        self.selection = selection
+        return changed & selection, changed & ~selection
+
+    def get_selections(self):
+        self.update_selection()
+        return list(iter_bits(self.selection))
+
+    def get_selected_count(self):
+        return bin(self.selection).count("1")
+
+
+class PlacementProgress:
+    """
+    progress callback for Placer.apply_plan, the progress dialog (with remaining time and a cancel button)
+    is shown only if placing takes longer than PROGRESS_DELAY seconds
+    """
+    def __init__(self, parent):
+        self.parent = parent
+        self.dialog = None
+        self.start = time.perf_counter()
+        self.cancelled = False
+
+    def __call__(self, done, total):
+        if self.dialog is None:
+            if time.perf_counter() - self.start < PROGRESS_DELAY:
+                return True
+            self.dialog = wx.ProgressDialog("Place footprints", "Placing footprints", maximum=total, parent=self.parent,
+                                            style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME
+                                            | wx.PD_REMAINING_TIME)
+        if self.dialog.GetRange() != total:
+            self.dialog.SetRange(total)
+        # updating the dialog also handles pending UI events, so the cancel button works
+        keep_going, skip = self.dialog.Update(min(done, total), "Placed %d of %d" % (done, total))
+        if not keep_going:
+            self.cancelled = True
+        return keep_going
+
+    def close(self):
+        if self.dialog is not None:
+            self.dialog.Destroy()
+            self.dialog = None
+
+
+class ErrorDialog(ErrorDialogGUI):
+    def SetSizeHints(self, sz1, sz2):
+        # DO NOTHING
+        pass
+
+    def __init__(self, parent):
+        super(ErrorDialog, self).__init__(parent)
+
+
+class PlaceBySheetDialog(PlaceBySheetGUI):
+    def SetSizeHints(self, sz1, sz2):
+        # DO NOTHING
+        pass
+
+    def __init__(self, parent, placer, ref_fp, user_units):
+        super(PlaceBySheetDialog, self).__init__(parent)
+        self.list_sheets = VirtualList.replace(self.list_sheets, self.on_selected)
+
+        self.placer = placer
+        self.user_units = user_units
+        self.ref_fp = ref_fp
+        self.ref_list = []
+        self.list_sheetsChoices = None
+
+        footprints = self.placer.get_footprints_on_sheet(self.ref_fp.sheet_id)
+        self.height, self.width = self.placer.get_footprints_bounding_box_size(footprints)
+
+        self.list_levels.Clear()
+        self.list_levels.AppendItems(self.ref_fp.filename)
+
+        if user_units == 'mm':
+            self.lbl_x_mag.SetLabelText(u"step x (mm):")
+            self.lbl_y_angle.SetLabelText(u"step y (mm):")
+        else:
+            self.lbl_x_mag.SetLabelText(u"step x (mils):")
+            self.lbl_y_angle.SetLabelText(u"step y (mils):")
+        self.lbl_columns_rad_step.Disable()
+        self.val_columns_rad_step.Disable()
+
+    def __del__(self):
+        # clear highlights
+        for ref in self.ref_list:
+            fp = self.placer.get_fp_by_ref(ref).fp
+            fp_clear_highlight(fp)
+
+    def modify_dialog_for_linear(self):
+        if self.user_units == 'mm':
+            self.lbl_x_mag.SetLabelText(u"step x (mm):")
+            self.lbl_y_angle.SetLabelText(u"step y (mm):")
+            self.val_x_mag.SetValue("%.3f" % self.width)
+            self.val_y_angle.SetValue("%.3f" % self.height)
+        else:
+            self.lbl_x_mag.SetLabelText(u"step x (mils):")
+            self.lbl_y_angle.SetLabelText(u"step y (mils):")
+            self.val_x_mag.SetValue("%.3f" % (self.width / 25.4))
+            self.val_y_angle.SetValue("%.3f" % (self.height / 25.4))
+        self.lbl_columns_rad_step.Disable()
+        self.val_columns_rad_step.Disable()
+
+    def modify_dialog_for_matrix(self):
+        if self.user_units == 'mm':
+            self.lbl_x_mag.SetLabelText(u"step x (mm):")
+            self.lbl_y_angle.SetLabelText(u"step y (mm):")
+            self.val_x_mag.SetValue("%.3f" % self.width)
+            self.val_y_angle.SetValue("%.3f" % self.height)
+        else:
+            self.lbl_x_mag.SetLabelText(u"step x (mils):")
+            self.lbl_y_angle.SetLabelText(u"step y (mils):")
+            self.val_x_mag.SetValue("%.3f" % (self.width / 25.4))
+            self.val_y_angle.SetValue("%.3f" % (self.height / 25.4))
+        self.lbl_columns_rad_step.SetLabelText(u"Nr.columns:")
+        self.lbl_columns_rad_step.Enable()
+        self.val_columns_rad_step.Enable()
+        # presume square arrangement,
+        # thus the number of columns should be equal to number of rows
+        self.val_columns_rad_step.Clear()
+        self.val_columns_rad_step.SetValue(str(int(round(math.sqrt(self.list_sheets.get_selected_count())))))
+
+    def modify_dialog_for_circular(self):
+        number_of_all_sheets = self.list_sheets.get_selected_count()
+        circumference = number_of_all_sheets * self.width
+        radius = circumference / (2 * math.pi)
+        angle = 360.0 / number_of_all_sheets
+        if self.user_units == 'mm':
+            self.lbl_x_mag.SetLabelText(u"radius (mm):")
+            self.val_x_mag.SetValue("%.3f" % radius)
+        else:
+            self.lbl_x_mag.SetLabelText(u"radius (mils):")
+            self.val_x_mag.SetValue("%.3f" % (radius / 25.4))
+        self.lbl_y_angle.SetLabelText(u"angle (deg):")
+        self.val_y_angle.SetValue("%.3f" % angle)
+        if self.user_units == 'mm':
+            self.lbl_columns_rad_step.SetLabelText(u"radial step (mm):")
+        else:
+            self.lbl_columns_rad_step.SetLabelText(u"radial step (mils):")
+        self.lbl_columns_rad_step.Enable()
+        self.val_columns_rad_step.SetValue("0.0")
+        self.val_columns_rad_step.Enable()
+
+    def modify_dialog_for_packed(self):
+        if self.user_units == 'mm':
+            self.lbl_x_mag.SetLabelText(u"spacing (mm):")
+            self.val_x_mag.SetValue("%.3f" % 1.0)
+        else:
+            self.lbl_x_mag.SetLabelText(u"spacing (mils):")
+            self.val_x_mag.SetValue("%.3f" % (1.0 / 25.4))
+        self.lbl_y_angle.SetLabelText(u"aspect ratio:")
+        self.val_y_angle.SetValue("%.3f" % 1.0)
+        self.lbl_columns_rad_step.Disable()
+        self.val_columns_rad_step.Disable()
+
+    def level_changed(self, event):
+        index = self.list_levels.GetSelection()
+
+        self.list_sheetsChoices = self.placer.get_sheets_to_replicate(self.ref_fp, self.ref_fp.sheet_id[index])
+
+        # clear highlights
+        for ref in self.ref_list:
+            fp = self.placer.get_fp_by_ref(ref).fp
+            fp_clear_highlight(fp)
+        pcbnew.Refresh()
+
+        # find matching anchors to matching sheets so that indices will match
+        self.ref_list = self.placer.get_sheet_anchors(self.ref_fp.fp_id, self.list_sheetsChoices)
+
+        # list text is only built for the rows being shown
+        self.list_sheets.set_items(len(self.ref_list),
+                                   lambda i: '/'.join(self.list_sheetsChoices[i]) + " (" + self.ref_list[i] + ")")
+
+        # by default select all sheets
+        self.list_sheets.select_all()
+
+        # highlight all footprints
+        for ref in self.ref_list:
+            fp = self.placer.get_fp_by_ref(ref).fp
+            fp_set_highlight(fp)
+        pcbnew.Refresh()
+
+        if self.com_arr.GetStringSelection() == u"Linear":
+            self.modify_dialog_for_linear()
+        if self.com_arr.GetStringSelection() == u"Matrix":
+            self.modify_dialog_for_matrix()
+        if self.com_arr.GetStringSelection() == u"Circular":
+            self.modify_dialog_for_circular()
+        if self.com_arr.GetStringSelection() == u"Packed":
+            self.modify_dialog_for_packed()
+
+    def on_selected(self, selected, deselected):
+        # set/clear highlight only on the rows which changed selection
+        for i in iter_bits(selected):
+            fp_set_highlight(self.placer.get_fp_by_ref(self.ref_list[i]).fp)
+        for i in iter_bits(deselected):
+            fp_clear_highlight(self.placer.get_fp_by_ref(self.ref_list[i]).fp)
+        pcbnew.Refresh()
+
+    def arr_changed(self, event):
+        if self.com_arr.GetStringSelection() == u"Linear":
+            self.modify_dialog_for_linear()
+        if self.com_arr.GetStringSelection() == u"Matrix":
+            self.modify_dialog_for_matrix()
+        if self.com_arr.GetStringSelection() == u"Circular":
+            self.modify_dialog_for_circular()
+        if self.com_arr.GetStringSelection() == u"Packed":
+            self.modify_dialog_for_packed()
+        event.Skip()
+
+
+class PlaceByReferenceDialog(PlaceByReferenceGUI):
+    # hack for new wxFormBuilder generating code incompatible with old wxPython
+    # noinspection PyMethodOverriding
+    def SetSizeHints(self, sz1, sz2):
+        # DO NOTHING
+        pass
+
+    def __init__(self, parent, placer, ref_fp, user_units):
+        super(PlaceByReferenceDialog, self).__init__(parent)
+        self.list_footprints = VirtualList.replace(self.list_footprints, self.on_selected)
+
+        self.placer = placer
+        self.user_units = user_units
+
+        # grab footprint data
+        self.ref_fp = ref_fp
+        self.height, self.width = self.placer.get_footprints_bounding_box_size([self.ref_fp])
+
+        # populate default values
+        if self.user_units == 'mm':
+            self.lbl_x_mag.SetLabelText(u"step x (mm):")
+            self.lbl_y_angle.SetLabelText(u"step y (mm):")
+        else:
+            self.lbl_x_mag.SetLabelText(u"step x (mils):")
+            self.lbl_y_angle.SetLabelText(u"step y (mils):")
+        self.lbl_columns_rad_step.Disable()
+        self.val_columns_rad_step.Disable()
+
+    def arr_changed(self, event):
+        # linear layout
+        if self.com_arr.GetStringSelection() == u"Linear":
+            if self.user_units == 'mm':
+                self.lbl_x_mag.SetLabelText(u"step x (mm):")
+                self.lbl_y_angle.SetLabelText(u"step y (mm):")
+                self.val_x_mag.SetValue("%.3f" % self.width)
+                self.val_y_angle.SetValue("%.3f" % self.height)
+            else:
+                self.lbl_x_mag.SetLabelText(u"step x (mils):")
+                self.lbl_y_angle.SetLabelText(u"step y (mils):")
+                self.val_x_mag.SetValue("%.3f" % (self.width / 25.4))
+                self.val_y_angle.SetValue("%.3f" % (self.height / 25.4))
+            self.lbl_columns_rad_step.Disable()
+            self.val_columns_rad_step.Disable()
+        # Matrix
+        if self.com_arr.GetStringSelection() == u"Matrix":
+            if self.user_units == 'mm':
+                self.lbl_x_mag.SetLabelText(u"step x (mm):")
+                self.lbl_y_angle.SetLabelText(u"step y (mm):")
+                self.val_x_mag.SetValue("%.3f" % self.width)
+                self.val_y_angle.SetValue("%.3f" % self.height)
+            else:
+                self.lbl_x_mag.SetLabelText(u"step x (mils):")
+                self.lbl_y_angle.SetLabelText(u"step y (mils):")
+                self.val_x_mag.SetValue("%.3f" % (self.width / 25.4))
+                self.val_y_angle.SetValue("%.3f" % (self.height / 25.4))
+            self.lbl_columns_rad_step.SetLabelText(u"Nr.columns:")
+            self.lbl_columns_rad_step.Enable()
+            self.val_columns_rad_step.Enable()
+            self.val_columns_rad_step.Clear()
+            self.val_columns_rad_step.SetValue(str(int(round(math.sqrt(self.list_footprints.get_selected_count())))))
+        # circular layout
+        if self.com_arr.GetStringSelection() == u"Circular":
+            number_of_all_footprints = self.list_footprints.get_selected_count()
+            circumference = number_of_all_footprints * self.width
+            radius = circumference / (2 * math.pi)
+            angle = 360.0 / number_of_all_footprints
+            if self.user_units == 'mm':
+                self.lbl_x_mag.SetLabelText(u"radius (mm):")
+                self.val_x_mag.SetValue("%.3f" % radius)
+            else:
+                self.lbl_x_mag.SetLabelText(u"radius (mils):")
+                self.val_x_mag.SetValue("%.3f" % (radius / 25.4))
+            self.lbl_y_angle.SetLabelText(u"angle (deg):")
+            self.val_y_angle.SetValue("%.3f" % angle)
+            if self.user_units == 'mm':
+                self.lbl_columns_rad_step.SetLabelText(u"radial step (mm):")
+            else:
+                self.lbl_columns_rad_step.SetLabelText(u"radial step (mils):")
+            self.lbl_columns_rad_step.Enable()
+            self.val_columns_rad_step.SetValue("0.0")
+            self.val_columns_rad_step.Enable()
+        event.Skip()
+
+    def on_selected(self, selected, deselected):
+        # set/clear highlight only on the rows which changed selection
+        for i in iter_bits(selected):
+            fp_set_highlight(self.placer.get_fp_by_ref(self.list_footprints.get_item_text(i)).fp)
+        for i in iter_bits(deselected):
+            fp_clear_highlight(self.placer.get_fp_by_ref(self.list_footprints.get_item_text(i)).fp)
+        pcbnew.Refresh()
+
+
+class InitialDialog(InitialDialogGUI):
+    BY_REFERENCE = 1025
+    BY_SHEET = 1026
+
+    # hack for new wxFormBuilder generating code incompatible with old wxPython
+    # noinspection PyMethodOverriding
+    def SetSizeHints(self, sz1, sz2):
+        # DO NOTHING
+        pass
+
+    def __init__(self, parent):
+        super(InitialDialog, self).__init__(parent)
+
+    def on_by_reference(self, event):
+        event.Skip()
+        self.EndModal(InitialDialog.BY_REFERENCE)
+
+    def on_by_sheet(self, event):
+        event.Skip()
+        self.EndModal(InitialDialog.BY_SHEET)
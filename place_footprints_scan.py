@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#  place_footprints_scan.py
+#
+# Copyright (C) 2022 Mitja Nemec
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+"""
+Scanning of saved .kicad_pcb files without loading the board. This module does not import pcbnew,
+so that the worker processes of scan_board_file start quickly with any multiprocessing start method.
+"""
+import concurrent.futures
+import logging
+import mmap
+import re
+
+# board files are scanned in chunks of footprint blocks, smaller files are scanned in a single process
+BOARD_SCAN_CHUNK_SIZE = 500
+FOOTPRINT_BLOCK_START = b'\n  (footprint '
+FOOTPRINT_BLOCK_END = b'\n  )'
+FP_TSTAMP = re.compile(rb'\(tstamp ([^)\s]+)\)')
+FP_PATH = re.compile(rb'\n    \(path "([^"]*)"\)')
+FP_SHEET_PROPERTY = re.compile(rb'\n    \(property "(Sheetfile|Sheetname)" "((?:[^"\\]|\\.)*)"\)')
+FP_REFERENCE = re.compile(rb'\n    \(fp_text reference "((?:[^"\\]|\\.)*)"')
+
+logger = logging.getLogger(__name__)
+
+
+def find_footprint_blocks(data):
+    """ get (start, stop) offsets of all top level footprint blocks in .kicad_pcb file contents """
+    blocks = []
+    start = data.find(FOOTPRINT_BLOCK_START)
+    while start != -1:
+        stop = data.find(FOOTPRINT_BLOCK_END, start + 1)
+        if stop == -1:
+            raise LookupError("Footprint block at offset " + str(start) + " is not closed")
+        stop = stop + len(FOOTPRINT_BLOCK_END)
+        blocks.append((start, stop))
+        start = data.find(FOOTPRINT_BLOCK_START, stop)
+    return blocks
+
+
+def unescape_file_string(value):
+    return re.sub(r'\\(.)', r'\1', value.decode('utf-8'))
+
+
+def scan_footprint_block(data, start, stop):
+    """
+    get (reference, KIID, path, (sheet name, sheet file)) of a footprint block in file contents,
+    sheet is None if the footprint does not have both sheet properties
+    """
+    kiid = FP_TSTAMP.search(data, start, stop).group(1).decode('utf-8')
+    match = FP_PATH.search(data, start, stop)
+    path = match.group(1).decode('utf-8') if match else ""
+    # the same as Placer.get_footprint_path
+    path = path.upper().replace('00000000-0000-0000-0000-0000', '').split("/")
+    properties = {x.group(1): unescape_file_string(x.group(2)) for x in FP_SHEET_PROPERTY.finditer(data, start, stop)}
+    if b'Sheetfile' in properties and b'Sheetname' in properties:
+        sheet = (properties[b'Sheetname'], properties[b'Sheetfile'])
+    else:
+        sheet = None
+    ref = unescape_file_string(FP_REFERENCE.search(data, start, stop).group(1))
+    return ref, kiid, path, sheet
+
+
+def scan_footprint_blocks(filename, blocks):
+    """ scan footprint blocks of a board file, the file is mapped again so that only offsets are passed around """
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return [scan_footprint_block(data, start, stop) for start, stop in blocks]
+
+
+def scan_board_file(filename, jobs=None, chunk_size=BOARD_SCAN_CHUNK_SIZE):
+    """
+    get (reference, KIID, path, sheet) of all footprints in a .kicad_pcb file, in file order, without loading the board
+    footprint blocks are found in a single pass and scanned in chunks across a process pool
+    """
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            blocks = find_footprint_blocks(data)
+            if len(blocks) <= chunk_size or jobs == 1:
+                return [scan_footprint_block(data, start, stop) for start, stop in blocks]
+
+    chunks = [blocks[x:x + chunk_size] for x in range(0, len(blocks), chunk_size)]
+    logger.info("Scanning %d footprints of %s in %d chunks", len(blocks), filename, len(chunks))
+    entries = []
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        for chunk_entries in executor.map(scan_footprint_blocks, [filename] * len(chunks), chunks):
+            entries.extend(chunk_entries)
+    return entries
@@ -3,59 +3,121 @@ import pcbnew
 import logging
 import sys
 import os
-from place_footprints import Placer
-import compare_boards
+import json
+import time
+import importlib.util
+import itertools
+import math
 import re
+import argparse
+import concurrent.futures
+import subprocess
+import place_footprints
+from place_footprints import Placer, Transform, RingBufferHandler, JsonFormatter, same_angle
+import compare_boards
+import place_footprints_daemon
 
+# time allowed for plugin registration when pcbnew starts
+IMPORT_TIME_BUDGET = 0.05
+# time allowed for slot assignment of a 500 footprint array
+ASSIGNMENT_TIME_BUDGET = 1.0
 
-def natural_sort(l):
-    convert = lambda text: int(text) if text.isdigit() else text.lower()
-    alphanum_key = lambda key: [convert(c) for c in re.split('([0-9]+)', key)]
-    return sorted(l, key=alphanum_key)
 
+TEST_PROJECTS_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), "place_footprints_test_projects")
+INPUT_BOARD = os.path.join(TEST_PROJECTS_FOLDER, 'place_footprints.kicad_pcb')
 
-def test(in_file, out_file, ref_fp_ref, mode, layout):
-    board = pcbnew.LoadBoard(in_file)
+# boards loaded by this process, filename -> [board, its state after loading]
+loaded_boards = {}
+
+# parameters used by parametrized layout tests
+LAYOUT_PARAMETERS = {'circular': {'radius': 10.0, 'delta_angle': 45.0, 'delta_radius': +1.0},
+                     'linear': {'step_x': 5.0, 'step_y': 0.0},
+                     'matrix': {'step_x': 5.0, 'step_y': 5.0, 'nr_columns': 3}}
+
+
+def get_board(filename=INPUT_BOARD):
+    """
+    get the board, it is loaded only once per process and its footprints are put back in place on each use
+    tests which change anything but footprint placement have to load their own board
+    """
+    entry = loaded_boards.get(filename)
+    if entry is None:
+        board = pcbnew.LoadBoard(filename)
+        entry = loaded_boards[filename] = [board, compare_boards.get_board_state(board)]
+    else:
+        compare_boards.restore_board_state(entry[0], entry[1])
+    return entry[0]
+
+
+def get_saved_state(filename):
+    """ get footprint placement saved in the board file, the file is read only once per process """
+    if filename not in loaded_boards:
+        get_board(filename)
+    return loaded_boards[filename][1]
+
+
+def get_pad_boxes(placer, footprints):
+    """ get (reference, (left, top, right, bottom)) bounding boxes of all pads of the footprints """
+    boxes = []
+    for fp_ref in footprints:
+        for pad in placer.get_fp_by_ref(fp_ref).fp.Pads():
+            box = pad.GetBoundingBox()
+            boxes.append((fp_ref, (box.GetLeft(), box.GetTop(), box.GetRight(), box.GetBottom())))
+    return boxes
 
-    placer = Placer(board)
 
+def boxes_overlap(box1, box2):
+    """ boxes which only touch do not overlap """
+    return box1[0] < box2[2] and box2[0] < box1[2] and box1[1] < box2[3] and box2[1] < box1[3]
+
+
+def write_nested_board(filename):
+    """
+    write a copy of the test board with two levels of hierarchy, Sheet1 and Sheet2 are moved into sheet Parent1
+    and Sheet3 and Sheet4 into Parent2, footprints of Sheet5 and Sheet6 are put directly on the parent sheets
+    """
+    parents = {'Sheet1': 1, 'Sheet2': 1, 'Sheet3': 2, 'Sheet4': 2}
+    parent_footprints = {'Sheet5': 1, 'Sheet6': 2}
+    with open(INPUT_BOARD, encoding='utf-8') as f:
+        blocks = f.read().split('\n  (footprint ')
+    for i, block in enumerate(blocks[1:], 1):
+        sheet_name = re.search(r'\(property "Sheetname" "([^"]*)"\)', block)
+        if sheet_name is None:
+            continue
+        sheet_name = sheet_name.group(1)
+        if sheet_name in parents:
+            parent_path = '/1111111%d-1111-1111-1111-111111111111' % parents[sheet_name]
+            blocks[i] = block.replace('(path "', '(path "' + parent_path, 1)
+        elif sheet_name in parent_footprints:
+            parent = parent_footprints[sheet_name]
+            block = re.sub(r'\(path "/[^/"]*/', '(path "/1111111%d-1111-1111-1111-111111111111/' % parent, block, 1)
+            block = block.replace('(property "Sheetname" "' + sheet_name + '")', '(property "Sheetname" "Parent%d")'
+                                  % parent, 1)
+            blocks[i] = block.replace('(property "Sheetfile" "Sheet.kicad_sch")',
+                                      '(property "Sheetfile" "Parent.kicad_sch")', 1)
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('\n  (footprint '.join(blocks))
+
+
+def get_footprints_to_place(placer, ref_fp_ref, mode):
     if mode == 'by ref':
-        footprint_reference_designator = ''.join(i for i in ref_fp_ref if not i.isdigit())
-        footprint_reference_number = int(''.join(i for i in ref_fp_ref if i.isdigit()))
-
-        # get list of all footprints with same reference designator
-        list_of_all_footprints_with_same_designator = placer.get_footprints_with_reference_designator(footprint_reference_designator)
-        sorted_list = natural_sort(list_of_all_footprints_with_same_designator)
-
-        list_of_consecutive_footprints=[]
-        start_index = sorted_list.index(ref_fp_ref)
-        count_start = footprint_reference_number
-        for fp in sorted_list[start_index:]:
-            if int(''.join(i for i in fp if i.isdigit())) == count_start:
-                count_start = count_start + 1
-                list_of_consecutive_footprints.append(fp)
-            else:
-                break
-
-        count_start = footprint_reference_number
-        reversed_list = list(reversed(sorted_list))
-        start_index = reversed_list.index(ref_fp_ref)
-        for fp in reversed_list[start_index:]:
-            if int(''.join(i for i in fp if i.isdigit())) == count_start:
-                count_start = count_start -1
-                list_of_consecutive_footprints.append(fp)
-            else:
-                break
-
-        sorted_footprints = natural_sort(list(set(list_of_consecutive_footprints)))
-
-    if mode == 'by sheet':
-        ref_footprint = placer.get_fp_by_ref(ref_fp_ref)
-        list_of_footprints = placer.get_list_of_footprints_with_same_id(ref_footprint.fp_id)
-        footprints = []
-        for fp in list_of_footprints:
-            footprints.append(fp.ref)
-        sorted_footprints = natural_sort(footprints)
+        # get the run of consecutive footprints with same reference designator
+        return placer.get_consecutive_footprints(ref_fp_ref)
+
+    ref_footprint = placer.get_fp_by_ref(ref_fp_ref)
+    list_of_footprints = placer.get_list_of_footprints_with_same_id(ref_footprint.fp_id)
+    footprints = []
+    for fp in list_of_footprints:
+        footprints.append(fp.ref)
+    return placer.natural_sort(footprints)
+
+
+def place_and_compare(test_file, ref_fp_ref, mode, layout):
+    board = get_board()
+
+    placer = Placer(board)
+
+    sorted_footprints = get_footprints_to_place(placer, ref_fp_ref, mode)
 
     if layout == 'circular':
         placer.place_circular(sorted_footprints, ref_fp_ref,
@@ -67,12 +129,8 @@ def test(in_file, out_file, ref_fp_ref, mode, layout):
         placer.place_matrix(sorted_footprints, ref_fp_ref,
                             step_x=5.0, step_y=5.0, nr_columns=3, step=3, rotation=15, copy_text_items=True)
 
-    saved = pcbnew.SaveBoard(out_file, board)
-    test_file = out_file.replace("temp", "test")
-
-    ret_val = compare_boards.compare_boards(out_file, test_file)
-    # remove the temporary board file
-    # os.remove(out_file)
+    # compare in memory with the board which was saved when the test was made
+    ret_val = compare_boards.compare_board_states(compare_boards.get_board_state(board), get_saved_state(test_file))
 
     return ret_val
 
@@ -80,49 +138,765 @@ def test(in_file, out_file, ref_fp_ref, mode, layout):
 class TestByRef(unittest.TestCase):
     def setUp(self):
         # basic setup
-        os.chdir(os.path.join(os.path.dirname(os.path.realpath(__file__)), "place_footprints_test_projects"))
-        self.input_file = 'place_footprints.kicad_pcb'
         self.ref_fp_ref = 'R202'
 
     def test_circular_by_ref(self):
-        output_file = self.input_file.split('.')[0] + "_temp_ref_circular" + ".kicad_pcb"
-        err = test(self.input_file, output_file, self.ref_fp_ref, 'by ref', 'circular')
+        test_file = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_test_ref_circular.kicad_pcb")
+        err = place_and_compare(test_file, self.ref_fp_ref, 'by ref', 'circular')
         self.assertEqual(err, 0, "Should be 0")
 
     def test_linear_by_ref(self):
-        output_file = self.input_file.split('.')[0] + "_temp_ref_linear" + ".kicad_pcb"
-        err = test(self.input_file, output_file, self.ref_fp_ref, 'by ref', 'linear')
+        test_file = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_test_ref_linear.kicad_pcb")
+        err = place_and_compare(test_file, self.ref_fp_ref, 'by ref', 'linear')
         self.assertEqual(err, 0, "Should be 0")
 
     def test_matrix_by_ref(self):
-        output_file = self.input_file.split('.')[0] + "_temp_ref_matrix" + ".kicad_pcb"
-        err = test(self.input_file, output_file, self.ref_fp_ref, 'by ref', 'matrix')
+        test_file = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_test_ref_matrix.kicad_pcb")
+        err = place_and_compare(test_file, self.ref_fp_ref, 'by ref', 'matrix')
         self.assertEqual(err, 0, "Should be 0")
 
 
 class TestBySheet(unittest.TestCase):
     def setUp(self):
         # basic setup
-        os.chdir(os.path.join(os.path.dirname(os.path.realpath(__file__)), "place_footprints_test_projects"))
-        self.input_file = 'place_footprints.kicad_pcb'
         self.ref_fp_ref = 'R401'
 
     def test_circular_by_ref(self):
-        output_file = self.input_file.split('.')[0] + "_temp_sheet_circular" + ".kicad_pcb"
-        err = test(self.input_file, output_file, self.ref_fp_ref, 'by sheet', 'circular')
+        test_file = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_test_sheet_circular.kicad_pcb")
+        err = place_and_compare(test_file, self.ref_fp_ref, 'by sheet', 'circular')
         self.assertEqual(err, 0, "Should be 0")
 
     def test_linear_by_ref(self):
-        output_file = self.input_file.split('.')[0] + "_temp_sheet_linear" + ".kicad_pcb"
-        err = test(self.input_file, output_file, self.ref_fp_ref, 'by sheet', 'linear')
+        test_file = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_test_sheet_linear.kicad_pcb")
+        err = place_and_compare(test_file, self.ref_fp_ref, 'by sheet', 'linear')
         self.assertEqual(err, 0, "Should be 0")
 
     def test_matrix_by_ref(self):
-        output_file = self.input_file.split('.')[0] + "_temp_sheet_matrix" + ".kicad_pcb"
-        err = test(self.input_file, output_file, self.ref_fp_ref, 'by sheet', 'matrix')
+        test_file = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_test_sheet_matrix.kicad_pcb")
+        err = place_and_compare(test_file, self.ref_fp_ref, 'by sheet', 'matrix')
         self.assertEqual(err, 0, "Should be 0")
 
 
+class TestTransform(unittest.TestCase):
+    def test_compose(self):
+        transform = Transform.translation(1000, 0).then(Transform.rotation(90, (0, 0))).then(Transform.flip((0, 500)))
+        self.assertEqual(transform.apply_int([(0, 0), (1000, 1000)]), [(0, 0), (-1000, -1000)])
+        self.assertEqual(transform.apply_orientation(30.0), 60.0)
+
+    def test_exact_translation(self):
+        self.assertEqual(Transform.translation(3, -4).apply([(10**12 + 1, 7)]), [(10**12 + 4, 3)])
+
+
+class TestReferenceIndex(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.placer = Placer(get_board())
+
+    def test_consecutive_footprints(self):
+        run = self.placer.get_consecutive_footprints('R205')
+        self.assertEqual(run, ['R201', 'R202', 'R203', 'R204', 'R205', 'R206', 'R207', 'R208'])
+        self.assertEqual(self.placer.get_consecutive_footprints('R101'), ['R101'])
+
+    def test_reference_not_in_index(self):
+        numbers = [1, 2, 3, 5, 6, 10]
+        self.placer.designator_index = {'R': place_footprints.Designator(
+            numbers, ['R' + str(x) for x in numbers], [x - i for i, x in enumerate(numbers)])}
+        self.assertEqual(self.placer.get_consecutive_footprints('R5'), ['R5', 'R6'])
+        self.assertEqual(self.placer.get_consecutive_footprints('R4'), ['R4'])
+        self.assertEqual(self.placer.get_consecutive_footprints('R11'), ['R11'])
+        # duplicate number is not in the index
+        self.assertEqual(self.placer.get_consecutive_footprints('R01'), ['R01'])
+
+    def test_range_and_gaps(self):
+        self.assertEqual(self.placer.get_footprints_in_range('R', 100, 163), ['R101'])
+        self.assertEqual(self.placer.get_footprints_in_range('R', 307, 402), ['R307', 'R308', 'R401', 'R402'])
+        gaps = self.placer.get_reference_gaps('R')
+        self.assertEqual(gaps[0:2], [(102, 200), (209, 300)])
+        self.assertEqual(len(self.placer.get_consecutive_runs('R')), len(gaps) + 1)
+
+    def test_natural_sort(self):
+        self.assertEqual(self.placer.natural_sort(['R801', 'R1000', 'R90', 'r100']), ['R90', 'r100', 'R801', 'R1000'])
+
+
+class TestMasks(unittest.TestCase):
+    def test_set_algebra(self):
+        placer = Placer(get_board())
+        ref_footprint = placer.get_fp_by_ref('R401')
+        on_sheet = placer.get_sheet_mask(ref_footprint.sheet_id)
+        same_id = placer.get_fp_id_mask(ref_footprint.fp_id)
+        resistors = placer.get_designator_mask('R')
+
+        self.assertEqual(placer.get_refs_in_mask(on_sheet & same_id), ['R401'])
+        not_on_sheet = placer.get_all_mask() & ~on_sheet
+        self.assertEqual(placer.get_refs_in_mask(not_on_sheet),
+                         [x.ref for x in placer.get_footprints_not_on_sheet(ref_footprint.sheet_id)])
+        self.assertEqual(same_id & ~resistors, 0)
+        self.assertEqual(placer.get_mask(['R401']), on_sheet & same_id)
+        self.assertEqual(list(place_footprints.iter_bits(place_footprints.bits_from_indices([17, 3, 9]))), [3, 9, 17])
+
+
+class TestSlotAssignment(unittest.TestCase):
+    def test_solvers(self):
+        cost = [[4, 1, 3, 7], [2, 0, 5, 1], [3, 2, 2, 6], [8, 4, 1, 3]]
+        best = min(sum(cost[i][x[i]] for i in range(4)) for x in itertools.permutations(range(4)))
+        assignment = place_footprints.solve_assignment(cost)
+        self.assertEqual(sum(cost[i][assignment[i]] for i in range(4)), best)
+        self.assertEqual(sorted(place_footprints.solve_assignment_greedy(cost)), [0, 1, 2, 3])
+
+    def test_unconnected_rows(self):
+        size = 500
+        connected = [[abs(row - column) * 1000.0 for column in range(size)] for row in range(size)]
+        for cost in ([[0.0] * size for row in range(size)],
+                     [connected[row] if row % 2 else [0.0] * size for row in range(size)]):
+            start_time = time.perf_counter()
+            assignment = place_footprints.solve_slot_assignment(cost)
+            self.assertLess(time.perf_counter() - start_time, ASSIGNMENT_TIME_BUDGET)
+            self.assertEqual(sorted(assignment), list(range(size)))
+            # footprints which are not connected keep their slots
+            self.assertTrue(all(assignment[row] == row for row in range(size) if not any(cost[row])))
+        self.assertEqual(place_footprints.solve_slot_assignment([[0, 0, 0], [5, 1, 3], [0, 0, 0]]), [0, 1, 2])
+        self.assertEqual(place_footprints.solve_slot_assignment([[0, 0, 0], [1, 5, 3], [0, 0, 0]]), [1, 0, 2])
+
+    def test_assign_slots(self):
+        placer = Placer(get_board())
+        footprints = placer.get_consecutive_footprints('R202')
+        plan = placer.plan_linear(footprints, 'R202', 5.0, 0.0, 1, 0)
+        assigned = placer.assign_slots(plan, 'R202')
+        self.assertIn(('R202', dict(plan)['R202']), assigned)
+        self.assertEqual(sorted(x[1] for x in assigned), sorted(x[1] for x in plan))
+
+        free = [x for x in plan if x[0] != 'R202']
+        cost = placer.get_slot_costs([x[0] for x in free], [x[1] for x in free])
+        slots = [x[1] for x in free]
+        new_slots = dict(assigned)
+        self.assertLessEqual(sum(cost[i][slots.index(new_slots[x[0]])] for i, x in enumerate(free)),
+                             sum(cost[i][i] for i in range(len(free))))
+
+
+class TestLockstep(unittest.TestCase):
+    def setUp(self):
+        # footprints are renamed, so the board can not be shared with other tests
+        self.board = pcbnew.LoadBoard(INPUT_BOARD)
+        for i in range(1, 6):
+            self.board.FindFootprintByReference('R30' + str(i)).SetReference('C20' + str(i + 2))
+        self.placer = Placer(self.board)
+
+    def test_rows(self):
+        rows = self.placer.get_lockstep_rows(['R204', 'C204'])
+        self.assertEqual(rows, [['R20' + str(i), 'C20' + str(i)] for i in range(3, 8)])
+        with self.assertRaises(LookupError):
+            self.placer.get_lockstep_rows(['R204', 'R304'])
+
+    def test_offsets(self):
+        ref_pose = self.placer.get_pose(self.placer.get_fp_by_ref('R204'))
+        other_pose = self.placer.get_pose(self.placer.get_fp_by_ref('C204'))
+        parameters = {'step_x': 5.0, 'step_y': 0.0, 'step': 1, 'rotation': 0}
+        self.placer.place_lockstep('linear', ['R204', 'C204'], parameters, False)
+        for i in range(3, 8):
+            position = self.placer.get_pose(self.placer.get_fp_by_ref('R20' + str(i))).position
+            other_position = self.placer.get_pose(self.placer.get_fp_by_ref('C20' + str(i))).position
+            self.assertEqual(position, (ref_pose.position[0] + (i - 4) * 5000000, ref_pose.position[1]))
+            self.assertEqual(other_position, (position[0] + other_pose.position[0] - ref_pose.position[0],
+                                              position[1] + other_pose.position[1] - ref_pose.position[1]))
+
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        # footprints are renamed and removed, so the board can not be shared with other tests
+        self.board = pcbnew.LoadBoard(INPUT_BOARD)
+
+    def test_refresh(self):
+        placer = Placer(self.board)
+        placer.get_designator_index()
+        self.board.FindFootprintByReference('R205').SetReference('R209')
+        self.board.Remove(self.board.FindFootprintByReference('R101'))
+        placer.refresh(self.board)
+
+        fresh = Placer(self.board)
+        self.assertEqual(sorted(placer.refs), sorted(fresh.refs))
+        self.assertEqual(placer.get_designator_index(), fresh.get_designator_index())
+        self.assertEqual(placer.get_consecutive_footprints('R201'), ['R201', 'R202', 'R203', 'R204'])
+        self.assertEqual(placer.get_fp_by_ref('R209').sheet_id, fresh.get_fp_by_ref('R209').sheet_id)
+        self.assertEqual(placer.get_fp_by_ref('R209').fp.GetReference(), 'R209')
+
+    def test_refresh_same_numbers(self):
+        placer = Placer(self.board)
+        placer.get_designator_index()
+        # R0201 has the same number as R201 and takes its place in the index
+        self.board.FindFootprintByReference('R205').SetReference('R0201')
+        placer.refresh(self.board)
+        self.assertEqual(placer.get_designator_index(), Placer(self.board).get_designator_index())
+        self.assertEqual(placer.get_consecutive_footprints('R0201'), ['R0201', 'R202', 'R203', 'R204'])
+        # once it is removed, R201 is put back
+        self.board.Remove(self.board.FindFootprintByReference('R0201'))
+        placer.refresh(self.board)
+        self.assertEqual(placer.get_designator_index(), Placer(self.board).get_designator_index())
+        self.assertEqual(placer.get_consecutive_footprints('R201'), ['R201', 'R202', 'R203', 'R204'])
+
+
+class TestLazyPlacer(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.board = get_board()
+
+    def test_same_as_eager(self):
+        eager = Placer(self.board)
+        lazy = Placer(self.board, lazy=True)
+        ref_fp = lazy.get_fp_by_ref('R401')
+        self.assertEqual(ref_fp.sheet_id, eager.get_fp_by_ref('R401').sheet_id)
+        same_id = [fp.ref for fp in lazy.iter_footprints_with_same_id(ref_fp.fp_id)]
+        self.assertEqual(lazy.natural_sort(same_id),
+                         lazy.natural_sort(fp.ref for fp in eager.get_list_of_footprints_with_same_id(ref_fp.fp_id)))
+        self.assertEqual(lazy.get_sheets_to_replicate(ref_fp, ref_fp.sheet_id[0]),
+                         eager.get_sheets_to_replicate(eager.get_fp_by_ref('R401'), ref_fp.sheet_id[0]))
+        self.assertEqual(lazy.get_consecutive_footprints('R202'), eager.get_consecutive_footprints('R202'))
+
+    def test_footprints_without_sheet_properties(self):
+        with open(INPUT_BOARD, encoding='utf-8') as f:
+            blocks = f.read().split('\n  (footprint ')
+        board_file = os.path.join(TEST_PROJECTS_FOLDER, 'place_footprints_temp_lazy.kicad_pcb')
+        with open(board_file, 'w', encoding='utf-8') as f:
+            f.write('\n  (footprint '.join(re.sub(r'\n    \(property "Sheet(file|name)" "[^"]*"\)', '', x)
+                                           if '(fp_text reference "R403"' in x else x for x in blocks))
+        try:
+            board = pcbnew.LoadBoard(board_file)
+        finally:
+            os.remove(board_file)
+        # both modes leave out the footprint without sheet properties
+        eager = Placer(board)
+        lazy = Placer(board, lazy=True)
+        self.assertIsNone(eager.get_fp_by_ref('R403'))
+        self.assertIsNone(lazy.get_fp_by_ref('R403'))
+        ref_fp = lazy.get_fp_by_ref('R401')
+        self.assertEqual(lazy.natural_sort(fp.ref for fp in lazy.iter_footprints_with_same_id(ref_fp.fp_id)),
+                         lazy.natural_sort(fp.ref for fp in eager.iter_footprints_with_same_id(ref_fp.fp_id)))
+        self.assertEqual(lazy.get_sheets_to_replicate(ref_fp, ref_fp.sheet_id[0]),
+                         eager.get_sheets_to_replicate(eager.get_fp_by_ref('R401'), ref_fp.sheet_id[0]))
+        lazy.resolve_refs()
+        self.assertEqual(sorted(lazy.refs), sorted(eager.refs))
+
+    def test_references_read_on_demand(self):
+        lazy = Placer(self.board, lazy=True)
+        self.assertEqual(lazy.get_consecutive_footprints('R205'),
+                         ['R201', 'R202', 'R203', 'R204', 'R205', 'R206', 'R207', 'R208'])
+        self.assertIsNone(lazy.get_fp_by_ref('R999'))
+        # only the run and its two missing neighbours were looked up
+        self.assertEqual(len([x for x in lazy.refs if x is not None]), 8)
+        self.assertLess(8, len(lazy.refs))
+
+
+class TestPlanCache(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.placer = Placer(get_board())
+
+    def test_reapply(self):
+        footprints = self.placer.get_consecutive_footprints('R202')
+        plan = self.placer.plan_linear(footprints, 'R202', 5.0, 0.0, 3, 15)
+        self.assertEqual(len(self.placer.apply_plan(plan, 'R202')), 8)
+        # same parameters give the same plan, which does not change anything anymore
+        self.assertIs(self.placer.plan_linear(footprints, 'R202', 5.0, 0.0, 3, 15), plan)
+        self.assertEqual(self.placer.apply_plan(plan, 'R202'), [])
+        # only the reference footprint stays in place
+        plan = self.placer.plan_linear(footprints, 'R202', 5.0, 1.0, 3, 15)
+        self.assertEqual(len(self.placer.apply_plan(plan, 'R202')), 7)
+
+    def test_reapply_edited_text(self):
+        footprints = self.placer.get_consecutive_footprints('R202')
+        plan = self.placer.plan_linear(footprints, 'R202', 5.0, 0.0, 3, 15)
+        self.placer.apply_plan(plan, 'R202')
+        text = self.placer.get_fp_by_ref('R205').fp.Reference()
+        position = text.GetPosition()
+        # text items edited by hand are put back by running the same placement again
+        text.SetPosition(pcbnew.wxPoint(position.x + 1000000, position.y))
+        self.assertEqual(self.placer.apply_plan(plan, 'R202'), ['R205'])
+        self.assertEqual(text.GetPosition(), position)
+        # so are the other text properties
+        height = text.GetTextHeight()
+        text.SetTextHeight(height + 100000)
+        self.assertEqual(self.placer.apply_plan(plan, 'R202'), ['R205'])
+        self.assertEqual(text.GetTextHeight(), height)
+        # and all text items are replicated again when the source text items change
+        src_text = self.placer.get_fp_by_ref('R202').fp.Reference()
+        src_text.SetBold(not src_text.IsBold())
+        self.assertEqual(self.placer.apply_plan(plan, 'R202'), [fp_ref for fp_ref, pose in plan])
+        self.assertEqual(text.IsBold(), src_text.IsBold())
+
+    def test_reapply_unnormalized_angles(self):
+        footprints = self.placer.get_consecutive_footprints('R202')
+        plan = self.placer.plan_linear(footprints, 'R202', 5.0, 0.0, 1, 90)
+        self.assertTrue(any(pose.orientation >= 360.0 for fp_ref, pose in plan))
+        self.placer.apply_plan(plan, 'R202')
+        self.assertEqual(self.placer.apply_plan(plan, 'R202'), [])
+        self.assertTrue(place_footprints.same_angle(-270.0, 90.0))
+        self.assertFalse(place_footprints.same_angle(-90.0, 90.0))
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.placer = Placer(get_board())
+        footprints = self.placer.get_consecutive_footprints('R202')
+        self.plan = self.placer.plan_linear(footprints, 'R202', 5.0, 0.0, 3, 15)
+
+    def test_complete(self):
+        calls = []
+        changed = self.placer.apply_plan(self.plan, 'R202', lambda done, total: calls.append((done, total)) or True)
+        self.assertEqual(len(changed), 8)
+        self.assertEqual(calls[-1], (16, 16))
+        self.assertEqual([x[0] for x in calls], sorted(x[0] for x in calls))
+
+    def test_cancel(self):
+        before = compare_boards.get_board_state(self.placer.board)
+        calls = []
+
+        def progress(done, total):
+            calls.append(done)
+            return len(calls) < 3
+        self.assertIsNone(self.placer.apply_plan(self.plan, 'R202', progress))
+        self.assertEqual(compare_boards.get_board_state(self.placer.board), before)
+        # rolled back placement does not count as applied
+        self.assertEqual(len(self.placer.apply_plan(self.plan, 'R202')), 8)
+
+
+class TestFootprintHashes(unittest.TestCase):
+    def test_board_and_file(self):
+        hashes = place_footprints.get_board_footprint_hashes(get_board())
+        self.assertEqual(place_footprints.get_file_footprint_hashes(INPUT_BOARD), hashes)
+
+    def test_changed_footprints(self):
+        placer = Placer(get_board())
+        before = place_footprints.get_board_footprint_hashes(placer.board)
+        footprints = placer.get_consecutive_footprints('R202')
+        plan = placer.plan_linear(footprints, 'R202', 5.0, 0.0, 3, 15)
+        moved = [fp_ref for fp_ref, pose in plan if placer.get_pose(placer.get_fp_by_ref(fp_ref)) != pose]
+        placer.apply_plan(plan)
+
+        after = place_footprints.get_board_footprint_hashes(placer.board)
+        self.assertEqual(place_footprints.get_changed_footprints(before, after), moved)
+        self.assertNotEqual(place_footprints.get_hashes_key(before), place_footprints.get_hashes_key(after))
+        del after['R101']
+        self.assertEqual(place_footprints.get_changed_footprints(before, after), ['R101'] + moved)
+
+    def test_unreadable_text_item(self):
+        with open(INPUT_BOARD, encoding='utf-8') as f:
+            contents = f.read()
+        broken_board = os.path.join(TEST_PROJECTS_FOLDER, 'place_footprints_temp_hashes.kicad_pcb')
+        with open(broken_board, 'w', encoding='utf-8') as f:
+            f.write(contents.replace('(fp_text reference "R101" (at', '(fp_text reference "R101" (pos', 1))
+        try:
+            with self.assertRaisesRegex(LookupError, 'R101'):
+                place_footprints.get_file_footprint_hashes(broken_board)
+        finally:
+            os.remove(broken_board)
+
+
+class TestSheetAnchors(unittest.TestCase):
+    def test_first_on_each_sheet(self):
+        placer = Placer(get_board())
+        ref_fp = placer.get_fp_by_ref('R401')
+        sheets = placer.get_sheets_to_replicate(ref_fp, ref_fp.sheet_id[0])
+        anchors = []
+        for sheet in sheets:
+            anchors.append(next(fp.ref for fp in placer.get_list_of_footprints_with_same_id(ref_fp.fp_id)
+                                if fp.sheet_id[0:len(sheet)] == sheet))
+        self.assertEqual(placer.get_sheet_anchors(ref_fp.fp_id, sheets), anchors)
+        self.assertNotIn('R401', anchors)
+
+
+class TestBoardFileScan(unittest.TestCase):
+    def test_same_as_board(self):
+        placer = Placer(get_board())
+        self.assertEqual(placer.scan_board_file(INPUT_BOARD), placer.scan_board(placer.board))
+
+    def test_parallel_chunks(self):
+        entries = place_footprints.scan_board_file(INPUT_BOARD, jobs=1)
+        self.assertEqual(place_footprints.scan_board_file(INPUT_BOARD, jobs=2, chunk_size=7), entries)
+        self.assertEqual(len(entries), len(get_board().GetFootprints()))
+
+    def test_workers_do_not_import_pcbnew(self):
+        # pool workers import only the scanning module, which has to load without pcbnew
+        script = "import sys, place_footprints_scan; sys.exit('pcbnew' in sys.modules)"
+        result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.realpath(__file__)))
+        self.assertEqual(result.returncode, 0)
+
+
+class TestTemplate(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.template_file = os.path.join(TEST_PROJECTS_FOLDER, 'place_footprints_temp_template.json')
+
+    def tearDown(self):
+        if os.path.exists(self.template_file):
+            os.remove(self.template_file)
+
+    def test_template_round_trip(self):
+        placer = Placer(get_board())
+        ref_footprint = placer.get_fp_by_ref('R401')
+        footprints = placer.natural_sort(x.ref for x in placer.get_list_of_footprints_with_same_id(ref_footprint.fp_id))
+        placer.place_circular(footprints, 'R401', 10.0, 45.0, 1.0, 1, 0, False)
+        placer.save_template(self.template_file, footprints, 'R401')
+        placed = [placer.get_pose(placer.get_fp_by_ref(x)) for x in footprints]
+
+        fresh = Placer(get_board())
+        fresh.place_template(self.template_file, 'R401', False)
+        for ref, pose in zip(footprints, placed):
+            new_pose = fresh.get_pose(fresh.get_fp_by_ref(ref))
+            self.assertAlmostEqual(new_pose.position[0], pose.position[0], delta=2)
+            self.assertAlmostEqual(new_pose.position[1], pose.position[1], delta=2)
+            self.assertAlmostEqual(new_pose.orientation % 360, pose.orientation % 360)
+        # footprints are matched by sheet instance, so the template can not be anchored on another instance
+        with self.assertRaises(LookupError):
+            fresh.plan_template(self.template_file, 'R201')
+
+    def test_template_other_side(self):
+        placer = Placer(get_board())
+        ref_footprint = placer.get_fp_by_ref('R401')
+        footprints = placer.natural_sort(x.ref for x in placer.get_list_of_footprints_with_same_id(ref_footprint.fp_id))
+        placer.place_circular(footprints, 'R401', 10.0, 45.0, 1.0, 1, 0, False)
+        placer.save_template(self.template_file, footprints, 'R401')
+        ref_pose = placer.get_pose(ref_footprint)
+        placed = [placer.get_pose(placer.get_fp_by_ref(x)) for x in footprints]
+
+        fresh = Placer(get_board())
+        anchor = fresh.get_fp_by_ref('R401')
+        anchor.fp.Flip(anchor.fp.GetPosition(), False)
+        anchor_pose = fresh.get_pose(anchor)
+        plan = dict(fresh.plan_template(self.template_file, 'R401'))
+        # the template is mirrored around the anchor
+        for ref, pose in zip(footprints, placed):
+            delta = Transform.rotation(ref_pose.orientation).apply_vector(
+                (pose.position[0] - ref_pose.position[0], pose.position[1] - ref_pose.position[1]))
+            expected = Transform.rotation(anchor_pose.orientation).then(Transform.flip()).apply_vector(delta)
+            self.assertAlmostEqual(plan[ref].position[0] - anchor_pose.position[0], expected[0], delta=2)
+            self.assertAlmostEqual(plan[ref].position[1] - anchor_pose.position[1], expected[1], delta=2)
+            self.assertNotEqual(plan[ref].flipped, pose.flipped)
+        self.assertEqual(plan['R401'].position, anchor_pose.position)
+        self.assertTrue(same_angle(plan['R401'].orientation, anchor_pose.orientation))
+
+        other = next(x.GetReference() for x in fresh.board.GetFootprints()
+                     if fresh.get_fp_by_ref(x.GetReference()).fp_id != anchor.fp_id)
+        with self.assertRaises(LookupError):
+            fresh.plan_template(self.template_file, other)
+
+
+class TestHierarchical(unittest.TestCase):
+    def test_single_level(self):
+        placer = Placer(get_board())
+        ref_footprint = placer.get_fp_by_ref('R401')
+        footprints = placer.natural_sort(x.ref for x in placer.get_list_of_footprints_with_same_id(ref_footprint.fp_id))
+        expected = placer.plan_linear(footprints, 'R401', 5.0, 0.0, 3, 15)
+
+        placer.place_hierarchical('R401', [('linear', {'step_x': 5.0, 'step_y': 0.0, 'step': 3, 'rotation': 15})],
+                                  False)
+        for fp_ref, pose in expected:
+            self.assertEqual(placer.get_pose(placer.get_fp_by_ref(fp_ref)), pose)
+
+    def test_two_levels(self):
+        board_file = os.path.join(TEST_PROJECTS_FOLDER, 'place_footprints_temp_nested.kicad_pcb')
+        write_nested_board(board_file)
+        try:
+            placer = Placer(pcbnew.LoadBoard(board_file))
+        finally:
+            os.remove(board_file)
+        self.assertEqual(placer.get_fp_by_ref('R401').sheet_id, ['Parent2', 'Sheet3'])
+        ref_position = placer.get_pose(placer.get_fp_by_ref('R401')).position
+
+        placer.place_hierarchical('R401', [('linear', {'step_x': 5.0, 'step_y': 0.0, 'step': 1, 'rotation': 0}),
+                                           ('linear', {'step_x': 20.0, 'step_y': 0.0, 'step': 1, 'rotation': 0})],
+                                  False)
+        # sheets are placed in their parent sheet and the parent sheets are placed as a whole
+        for fp_ref, offset in [('R201', -20.0), ('R301', -15.0), ('R401', 0.0), ('R501', 5.0)]:
+            pose = placer.get_pose(placer.get_fp_by_ref(fp_ref))
+            self.assertAlmostEqual(pose.position[0], ref_position[0] + offset * place_footprints.SCALE, delta=1)
+            self.assertAlmostEqual(pose.position[1], ref_position[1], delta=1)
+
+    def test_flipped_group(self):
+        placer = Placer(get_board())
+        group = placer.get_sheet_groups(['R401'], 1)[0]
+        self.assertGreater(len(group), 1)
+        leader_pose = placer.get_pose(placer.get_fp_by_ref('R401'))
+        poses = {x: placer.get_pose(placer.get_fp_by_ref(x)) for x in group}
+        for turn in [0, 90]:
+            target = place_footprints.Pose(leader_pose.position, -leader_pose.orientation + turn,
+                                           not leader_pose.flipped)
+            plan, item_moves = placer.plan_group_moves([('R401', target)], [group], False)
+            placer.apply_plan(plan)
+            # group is mirrored around the leader as pcbnew flips a selection, then turned around the leader
+            turn_around_leader = Transform.rotation(-turn, leader_pose.position)
+            for fp_ref in group:
+                pose = placer.get_pose(placer.get_fp_by_ref(fp_ref))
+                before = poses[fp_ref]
+                expected = turn_around_leader.apply_point((before.position[0],
+                                                           2 * leader_pose.position[1] - before.position[1]))
+                self.assertAlmostEqual(pose.position[0], expected[0], delta=1)
+                self.assertAlmostEqual(pose.position[1], expected[1], delta=1)
+                self.assertTrue(same_angle(pose.orientation, -before.orientation + turn))
+                self.assertNotEqual(pose.flipped, before.flipped)
+            placer.apply_plan([(fp_ref, pose) for fp_ref, pose in poses.items()])
+
+    def test_too_many_levels(self):
+        placer = Placer(get_board())
+        level = ('linear', {'step_x': 5.0, 'step_y': 0.0, 'step': 1, 'rotation': 0})
+        with self.assertRaises(LookupError):
+            placer.place_hierarchical('R401', [level, level], False)
+
+
+class TestPacked(unittest.TestCase):
+    def test_no_overlap(self):
+        placer = Placer(get_board())
+        ref_footprint = placer.get_fp_by_ref('R401')
+        footprints = placer.natural_sort(x.ref for x in placer.get_list_of_footprints_with_same_id(ref_footprint.fp_id))
+        groups = placer.get_sheet_groups(footprints, 1)
+        self.assertIn('R402', groups[footprints.index('R401')])
+        ref_position = placer.get_pose(ref_footprint).position
+
+        placer.place_packed(footprints, 'R401', groups, 1.0, 1.0, 1, 0, False)
+        self.assertEqual(placer.get_pose(ref_footprint).position, ref_position)
+        # whole groups are moved, so their boxes on the board do not overlap
+        boxes = [placer.get_footprints_bounding_box([placer.get_fp_by_ref(x) for x in group]) for group in groups]
+        for i, first in enumerate(boxes):
+            for second in boxes[i + 1:]:
+                self.assertTrue(first[1] < second[0] or second[1] < first[0] or
+                                first[3] < second[2] or second[3] < first[2])
+
+        # packing again from the board, not from the cached plan, keeps the sheets where they are
+        placer.plan_cache.clear()
+        self.assertEqual(placer.place_packed(footprints, 'R401', groups, 1.0, 1.0, 1, 0, False), [])
+
+    def test_move_sheets(self):
+        # tracks are moved too, so the board can not be shared with other tests
+        placer = Placer(pcbnew.LoadBoard(INPUT_BOARD))
+        ref_footprint = placer.get_fp_by_ref('R401')
+        footprints = placer.natural_sort(x.ref for x in placer.get_list_of_footprints_with_same_id(ref_footprint.fp_id))
+        groups = placer.get_sheet_groups(footprints, 1)
+        old_positions = {x: placer.get_pose(placer.get_fp_by_ref(x)).position for group in groups for x in group}
+
+        placer.place_packed(footprints, 'R401', groups, 1.0, 1.0, 1, 0, False, move_sheets=True)
+        # sheets are moved (and turned) as a whole
+        for fp_ref, group in zip(footprints, groups):
+            anchor = placer.get_pose(placer.get_fp_by_ref(fp_ref)).position
+            for x in group:
+                position = placer.get_pose(placer.get_fp_by_ref(x)).position
+                self.assertAlmostEqual(math.hypot(position[0] - anchor[0], position[1] - anchor[1]),
+                                       math.hypot(old_positions[x][0] - old_positions[fp_ref][0],
+                                                  old_positions[x][1] - old_positions[fp_ref][1]), delta=2)
+
+
+class TestRegistration(unittest.TestCase):
+    def test_lazy_import(self):
+        plugin_folder = os.path.dirname(os.path.realpath(__file__))
+        spec = importlib.util.spec_from_file_location('place_footprints_plugin',
+                                                      os.path.join(plugin_folder, '__init__.py'),
+                                                      submodule_search_locations=[plugin_folder])
+        plugin = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = plugin
+        try:
+            start = time.perf_counter()
+            spec.loader.exec_module(plugin)
+            duration = time.perf_counter() - start
+            # the plugin has to register without falling back to the error notification
+            self.assertEqual(plugin.PlaceFootprints.__module__, spec.name + '.action_place_footprints')
+            self.assertNotIn(spec.name + '.place_footprints_dialogs', sys.modules)
+            self.assertNotIn(spec.name + '.place_footprints', sys.modules)
+            self.assertIsNone(plugin.PlaceFootprints().version)
+            self.assertLess(duration, IMPORT_TIME_BUDGET)
+        finally:
+            for name in [x for x in sys.modules if x.startswith(spec.name)]:
+                del sys.modules[name]
+
+
+class TestLogBuffer(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.log_file = os.path.join(TEST_PROJECTS_FOLDER, 'place_footprints_temp.log')
+        self.logger = logging.getLogger('place_footprints_test')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        for handler in self.logger.handlers[:]:
+            self.logger.removeHandler(handler)
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+
+    def test_flush(self):
+        handler = RingBufferHandler(self.log_file, capacity=3)
+        self.logger.addHandler(handler)
+        for i in range(5):
+            self.logger.info("record %d", i)
+        self.assertFalse(os.path.exists(self.log_file))
+        handler.flush()
+        with open(self.log_file) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines, ["2 older log records were dropped", "record 2", "record 3", "record 4"])
+
+    def test_error_json(self):
+        handler = RingBufferHandler(self.log_file)
+        handler.setFormatter(JsonFormatter())
+        self.logger.addHandler(handler)
+        self.logger.info("footprints: %r", ['R1', 'R2'])
+        self.logger.error("failed")
+        with open(self.log_file) as f:
+            records = [json.loads(x) for x in f]
+        self.assertEqual([x['message'] for x in records], ["footprints: ['R1', 'R2']", "failed"])
+        self.assertEqual(records[1]['level'], 'ERROR')
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.server = place_footprints_daemon.PlacementServer()
+        self.saved_board = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_temp_daemon.kicad_pcb")
+
+    def tearDown(self):
+        if os.path.exists(self.saved_board):
+            os.remove(self.saved_board)
+
+    def request(self, method, **params):
+        return self.server.handle_request(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params}))
+
+    def test_place(self):
+        footprints = self.request('footprints_with_same_id', board=INPUT_BOARD,
+                                  reference='R401')['result']
+        self.assertEqual(footprints[0], 'R201')
+        placer = self.server.get_placer(INPUT_BOARD)
+        expected = placer.plan_linear(footprints, 'R401', 5.0, 0.0, 1, 0)
+
+        response = self.request('place', board=INPUT_BOARD, layout='linear',
+                                footprints=footprints, reference='R401',
+                                parameters={'step_x': 5.0, 'step_y': 0.0, 'step': 1, 'rotation': 0})
+        self.assertIn('result', response)
+        # the same board and placer are reused
+        self.assertIs(self.server.get_placer(INPUT_BOARD), placer)
+        for fp_ref, pose in expected:
+            self.assertEqual(placer.get_pose(placer.get_fp_by_ref(fp_ref)), pose)
+
+    def test_unsaved_boards_kept(self):
+        self.server.cache_size = 1
+        self.request('place', board=INPUT_BOARD, layout='linear', footprints=['R201', 'R202', 'R203'],
+                     reference='R201', parameters={'step_x': 5.0, 'step_y': 0.0, 'step': 1, 'rotation': 0})
+        other_board = os.path.join(TEST_PROJECTS_FOLDER, "place_footprints_test_ref_linear.kicad_pcb")
+        self.assertIn('result', self.request('load', board=other_board))
+        self.assertIn(os.path.abspath(INPUT_BOARD), self.server.boards)
+        # board file changed on disk is not reloaded over unsaved placement
+        self.server.boards[os.path.abspath(INPUT_BOARD)][2] = 0
+        response = self.request('load', board=INPUT_BOARD)
+        self.assertEqual(response['error']['code'], place_footprints_daemon.PLACEMENT_ERROR)
+        self.assertIn('R202', response['error']['message'])
+        response = self.request('save', board=INPUT_BOARD, filename=self.saved_board)
+        self.assertEqual(response['result'], self.saved_board)
+
+    def test_errors(self):
+        self.assertEqual(self.request('unknown')['error']['code'], place_footprints_daemon.METHOD_NOT_FOUND)
+        self.assertEqual(self.request('load')['error']['code'], place_footprints_daemon.INVALID_PARAMS)
+        self.assertEqual(self.server.handle_request('{')['error']['code'], place_footprints_daemon.PARSE_ERROR)
+        response = self.request('place', board=INPUT_BOARD, layout='packed', footprints=['R201', 'R301'],
+                                reference='R201', parameters={}, assign_by_connectivity=True)
+        self.assertEqual(response['error']['code'], place_footprints_daemon.INVALID_PARAMS)
+        # parameters of the layout are checked while placing
+        response = self.request('place', board=INPUT_BOARD, layout='linear', footprints=['R201', 'R202'],
+                                reference='R201', parameters={'step_x': 5.0, 'spacing': 1.0})
+        self.assertEqual(response['error']['code'], place_footprints_daemon.PLACEMENT_ERROR)
+
+
+class TestSchematicHierarchy(unittest.TestCase):
+    def setUp(self):
+        # basic setup
+        self.placer = Placer(get_board())
+        self.cache_file = os.path.join(self.placer.project_folder, place_footprints.HIERARCHY_CACHE_FILE)
+
+    def tearDown(self):
+        if os.path.exists(self.cache_file):
+            os.remove(self.cache_file)
+
+    def test_hierarchy_cache(self):
+        parsed = {}
+        self.placer.parse_schematic_files(self.placer.sch_filename, parsed)
+        self.assertEqual(self.placer.get_schematic_hierarchy(), parsed)
+        self.assertTrue(os.path.exists(self.cache_file))
+        # second time the hierarchy comes from the cache
+        self.placer.parse_schematic_files = None
+        self.assertEqual(self.placer.get_schematic_hierarchy(), parsed)
+
+    def test_files_read_once(self):
+        read_files = []
+
+        def read_schematic_file(filename):
+            read_files.append(filename)
+            return Placer.read_schematic_file(filename)
+        self.placer.read_schematic_file = read_schematic_file
+        parsed = {}
+        self.placer.parse_schematic_files(self.placer.sch_filename, parsed)
+        # each sheet file is read only once, however many sheets use it
+        self.assertEqual(sorted(read_files), sorted({self.placer.sch_filename} | {x[1] for x in parsed.values()}))
+        self.assertLess(len(read_files), len(parsed) + 1)
+
+
+class TestLayouts(unittest.TestCase):
+    """ test methods are added below, one for each set of layout parameters """
+    def check_layout(self, ref_fp_ref, mode, layout, step, rotation):
+        placer = Placer(get_board())
+        footprints = get_footprints_to_place(placer, ref_fp_ref, mode)
+        # matrix is built from the first footprint, other layouts around the reference footprint
+        anchor = footprints[0] if layout == 'matrix' else ref_fp_ref
+        anchor_position = placer.get_pose(placer.get_fp_by_ref(anchor)).position
+        parameters = dict(LAYOUT_PARAMETERS[layout], step=step, rotation=rotation)
+        plan = placer.plan_layout(layout, footprints, ref_fp_ref, parameters, None)
+        placer.apply_plan(plan, ref_fp_ref)
+
+        # anchor footprint stays in place and pads of no two footprints overlap
+        self.assertEqual(placer.get_pose(placer.get_fp_by_ref(anchor)).position, anchor_position)
+        boxes = get_pad_boxes(placer, footprints)
+        for (ref1, box1), (ref2, box2) in itertools.combinations(boxes, 2):
+            if ref1 != ref2:
+                self.assertFalse(boxes_overlap(box1, box2), "pads of %s and %s overlap" % (ref1, ref2))
+        # placing again does not change anything
+        self.assertEqual(placer.apply_plan(plan, ref_fp_ref), [])
+
+
+def make_layout_test(ref_fp_ref, mode, layout, step, rotation):
+    def test(self):
+        self.check_layout(ref_fp_ref, mode, layout, step, rotation)
+    return test
+
+
+for (ref_fp_ref, mode), layout, step, rotation in itertools.product([('R202', 'by ref'), ('R401', 'by sheet')],
+                                                                  LAYOUT_PARAMETERS, [1, 3], [0, 15, 90]):
+    setattr(TestLayouts, 'test_%s_%s_step_%d_rotation_%d' % (layout, mode.replace(' ', '_'), step, rotation),
+            make_layout_test(ref_fp_ref, mode, layout, step, rotation))
+
+
+def run_tests(test_names):
+    """ run tests in a worker process, boards loaded by earlier tests in the same worker are reused """
+    suite = unittest.defaultTestLoader.loadTestsFromNames(test_names, sys.modules[__name__])
+    result = unittest.TestResult()
+    suite.run(result)
+    return result.testsRun, [(str(test), text) for test, text in result.failures + result.errors]
+
+
+def run_parallel(jobs):
+    """ run all tests of this module in jobs worker processes, returns True if all of them passed """
+    suite = unittest.defaultTestLoader.loadTestsFromModule(sys.modules[__name__])
+    test_names = ['.'.join(test.id().split('.')[-2:]) for class_suite in suite for test in class_suite]
+    # tests of a class are handed out in chunks, so that each worker loads the board only a few times
+    chunk_size = max(1, len(test_names) // (4 * jobs))
+    chunks = [test_names[i:i + chunk_size] for i in range(0, len(test_names), chunk_size)]
+
+    start = time.perf_counter()
+    tests_run = 0
+    problems = []
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        for chunk_run, chunk_problems in executor.map(run_tests, chunks):
+            tests_run = tests_run + chunk_run
+            problems.extend(chunk_problems)
+    for test, text in problems:
+        print("=" * 70 + "\nFAIL: " + test + "\n" + "-" * 70 + "\n" + text)
+    print("Ran %d tests in %.3fs with %d workers" % (tests_run, time.perf_counter() - start, jobs))
+    print("FAILED (problems=%d)" % len(problems) if problems else "OK")
+    return not problems
+
+
 if __name__ == '__main__':
     file_handler = logging.FileHandler(filename='place_footprints.log', mode='w')
     stdout_handler = logging.StreamHandler(sys.stdout)
@@ -141,4 +915,10 @@ if __name__ == '__main__':
     logger.info("Plugin executed with python version: " + repr(sys.version))
     logger.info("KiCad build version: " + str(pcbnew.GetBuildVersion()))
 
-    unittest.main()
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--jobs', type=int, help="run tests in parallel in this many worker processes")
+    args, unittest_args = parser.parse_known_args()
+    if args.jobs is None:
+        unittest.main(argv=sys.argv[0:1] + unittest_args)
+    else:
+        sys.exit(0 if run_parallel(args.jobs) else 1)